@@ -15,10 +15,11 @@
 #
 # Modified by Davide Pedranz <davide.pedranz@gmail.com>
 
+import sys
 import math
-import copy
 from module import Module
 from event import Event
+from packet import Reception
 
 
 class Channel(Module):
@@ -31,6 +32,8 @@ class Channel(Module):
 
     # communication range parameter in config file
     PAR_RANGE = "range"
+    # coalesce the START_RX and END_RX events of a transmission parameter
+    PAR_COALESCE = "coalesce"
 
     # speed of light in m/s, used to compute propagation delay
     SOL = 299792458.0
@@ -46,10 +49,26 @@ class Channel(Module):
         Module.__init__(self)
         # get transmission range from configuration parameters
         self.range = config.get_param(self.PAR_RANGE)
+        # if enabled, schedule a single event for the beginning and a single
+        # event for the end of each transmission instead of one START_RX and
+        # one END_RX event for each receiver. this pays off only when nodes
+        # have many neighbors: with few of them, dispatching the receivers
+        # from the broadcast events costs more than the saved queue operations
+        self.coalesce = config.get_param(self.PAR_COALESCE, False)
         # list of all communication nodes in the simulation
         self.nodes = []
+        # spatial index: maps each cell of a uniform grid, with cells as large
+        # as the communication range, to the list of nodes inside it. the
+        # neighbors of a node can only be in its cell or in the adjacent ones
+        self.cells = {}
         # map of neighbors that maps each node id to the list of its neighbors
         self.neighbors = {}
+        # map of links that maps each node id to a list of (neighbor,
+        # propagation delay, probability of correct reception) tuples. the
+        # topology is static, so these values are computed only once
+        self.links = {}
+        # same as links, but sorted by propagation delay. computed when needed
+        self.sorted_links = {}
 
     def register_node(self, node):
         """
@@ -61,6 +80,34 @@ class Channel(Module):
         self.nodes.append(node)
         # recompute the neighbors of all nodes considering the new node as well
         self.recompute_neighbors(node)
+        # add the node to the spatial index
+        self.cells.setdefault(self.cell(node), []).append(node)
+
+    def cell(self, node):
+        """
+        Computes the cell of the spatial index containing a node
+        :param node: the node
+        :returns: (column, row) of the cell
+        """
+        return (int(math.floor(node.get_posx() / self.range)),
+                int(math.floor(node.get_posy() / self.range)))
+
+    def nearby_nodes(self, node):
+        """
+        Returns the registered nodes in the cell of a node and in the adjacent
+        ones, i.e., the only nodes that can be within its communication range
+        :param node: the node
+        :returns: list of nodes, sorted by registration order
+        """
+        (x, y) = self.cell(node)
+        nearby = []
+        for i in (x - 1, x, x + 1):
+            for j in (y - 1, y, y + 1):
+                nearby.extend(self.cells.get((i, j), ()))
+        # keep the order of registration, so that neighbors are always
+        # notified in the same order
+        nearby.sort(key=lambda n: n.get_id())
+        return nearby
 
     def distance(self, a, b):
         """
@@ -74,20 +121,35 @@ class Channel(Module):
     def recompute_neighbors(self, new_node):
         """
         Updates the map of neighbors, i.e., for each node it computes the list
-        of nodes within communication range and stores such list
+        of nodes within communication range and stores such list. Only the
+        nodes close to the new one are considered
         :param new_node: the node just added to the simulation
         """
-        # neighbors for the newest node
+        # neighbors and links for the newest node
         new_node_neighbors = []
-        for n in self.nodes:
+        new_node_links = []
+        for n in self.nearby_nodes(new_node):
+            if n.get_id() == new_node.get_id():
+                continue
+            distance = self.distance(n, new_node)
             # if the node n is within communication range of the newest node
-            if n.get_id() != new_node.get_id() and \
-                    self.distance(n, new_node) < self.range:
+            if distance < self.range:
                 # add n to the neighbors of the new node and vice versa
                 new_node_neighbors.append(n)
                 self.neighbors[n.get_id()].append(new_node)
-        # save neighbors for the new node in the map
+                # compute the probability of correct reception (if no
+                # collision) according to the "Realistic Propagation" model
+                prob_correct = 1 - distance / self.range
+                # compute propagation delay: distance / speed of light
+                propagation_delay = distance / Channel.SOL
+                new_node_links.append((n, propagation_delay, prob_correct))
+                self.links[n.get_id()].append(
+                    (new_node, propagation_delay, prob_correct))
+        # save neighbors and links for the new node in the maps
         self.neighbors[new_node.get_id()] = new_node_neighbors
+        self.links[new_node.get_id()] = new_node_links
+        # links have changed, they need to be sorted again
+        self.sorted_links = {}
 
     def start_transmission(self, source_node, packet):
         """
@@ -96,24 +158,81 @@ class Channel(Module):
         :param source_node: node that starts the transmission
         :param packet: packet being transmitted
         """
-        for neighbor in self.neighbors[source_node.get_id()]:
-            # compute the distance from the receiver
-            distance = self.distance(source_node, neighbor)
+        if self.coalesce:
+            self.start_broadcast(source_node, packet)
+            return
+        now = self.sim.get_time()
+        for (neighbor, propagation_delay, prob_correct) in \
+                self.links[source_node.get_id()]:
+            # generate and schedule START_RX event at receiver
+            # each receiver gets its own reception of the packet, as they will
+            # process the packet in different ways. one node might be able to
+            # receive it, one node might not
+            event = Event(now + propagation_delay, Event.START_RX, neighbor,
+                          source_node, Reception(packet, prob_correct))
+            self.sim.schedule_event(event)
 
-            # compute the probability of correct reception (if no collision)
-            # according to the "Realistic Propagation" model
-            prob_correct = 1 - distance / self.range
-            packet.set_prob_correct(prob_correct)
+    def start_broadcast(self, source_node, packet):
+        """
+        Schedules a single event for the beginning of the reception of a frame
+        at all neighbors. The event happens when the frame reaches the closest
+        neighbor: the propagation delays, in the order of nanoseconds, are only
+        used to sort the receivers
+        :param source_node: node that starts the transmission
+        :param packet: packet being transmitted
+        """
+        links = self.sorted_links.get(source_node.get_id())
+        if links is None:
+            links = sorted(self.links[source_node.get_id()],
+                           key=lambda link: link[1])
+            self.sorted_links[source_node.get_id()] = links
+        if len(links) == 0:
+            return
+        event = Event(self.sim.get_time() + links[0][1],
+                      Event.START_BROADCAST, self, source_node, packet)
+        self.sim.schedule_event(event)
 
-            # compute propagation delay: distance / speed of light
-            propagation_delay = distance / Channel.SOL
+    def handle_event(self, event):
+        """
+        Handles events notified to the channel
+        :param event: the event
+        """
+        if event.get_type() == Event.START_BROADCAST:
+            self.handle_start_broadcast(event)
+        elif event.get_type() == Event.END_BROADCAST:
+            self.handle_end_broadcast(event)
+        else:
+            print("Channel has received a notification for event type %d "
+                  "which can't be handled" % event.get_type())
+            sys.exit(1)
 
-            # generate and schedule START_RX event at receiver
-            # be sure to make a copy of the packet and not pass the same
-            # reference to multiple nodes, as they will process the packet in
-            # different ways. one node might be able to receive it, one node
-            # might not
-            event = Event(self.sim.get_time() + propagation_delay,
-                          Event.START_RX, neighbor, source_node,
-                          copy.deepcopy(packet))
-            self.sim.schedule_event(event)
+    def handle_start_broadcast(self, event):
+        """
+        Notifies the beginning of a frame to all neighbors of the source, in
+        order of propagation delay, and schedules the end of the frame
+        :param event: the START_BROADCAST event
+        """
+        source_node = event.get_source()
+        packet = event.get_obj()
+        now = self.sim.get_time()
+        receptions = []
+        for (neighbor, propagation_delay, prob_correct) in \
+                self.sorted_links[source_node.get_id()]:
+            reception = Reception(packet, prob_correct)
+            neighbor.handle_event(Event(now, Event.START_RX, neighbor,
+                                        source_node, reception))
+            receptions.append((neighbor, reception))
+        end = Event(now + packet.get_duration(), Event.END_BROADCAST, self,
+                    source_node, receptions)
+        self.sim.schedule_event(end)
+
+    def handle_end_broadcast(self, event):
+        """
+        Notifies the end of a frame to all neighbors that received its
+        beginning, in the same order
+        :param event: the END_BROADCAST event
+        """
+        now = self.sim.get_time()
+        for (neighbor, reception) in event.get_obj():
+            neighbor.handle_event(Event(now, Event.END_RX, neighbor, neighbor,
+                                        reception))
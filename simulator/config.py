@@ -16,6 +16,7 @@
 # Modified by Davide Pedranz <davide.pedranz@gmail.com>
 
 import json
+import hashlib
 import re
 import sys
 
@@ -144,11 +145,12 @@ class Config:
             match = cr.search(content)
         return content
 
-    def get_param(self, param):
+    def get_param(self, param, default=None):
         """
         Returns the value of a parameter from the configuration file. Throws an
-        error if the parameter is not found
+        error if the parameter is not found and no default value is given
         :param param: the parameter's name
+        :param default: value returned if the parameter is not found
         """
         # first check that param exists
         if param in self.cfg[self.section]:
@@ -161,6 +163,8 @@ class Config:
             # value. Just return it
             else:
                 return self.cfg[self.section][param]
+        elif default is not None:
+            return default
         else:
             print("Error: parameter %s not found in section %s",
                   (param, self.section))
@@ -270,6 +274,23 @@ class Config:
     def get_output_file(self):
         return self.output_file
 
+    def get_run_params(self):
+        """
+        Returns the values of all the parameters for the current run number,
+        i.e., with the parameters given as a list of values resolved
+        :returns: map from parameter name to value
+        """
+        return dict((p, self.get_param(p)) for p in self.cfg[self.section])
+
+    def get_hash(self):
+        """
+        Returns a hash of the configuration section, identifying the set of
+        runs it defines
+        :returns: SHA-1 digest of the section, as an hexadecimal string
+        """
+        content = json.dumps(self.cfg[self.section], sort_keys=True)
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
     def get_params(self, run_number):
         """
         Returns a textual representation of simulation parameters for a given
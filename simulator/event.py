@@ -16,11 +16,15 @@
 # Modified by Davide Pedranz <davide.pedranz@gmail.com>
 
 
-class Event:
+class Event(object):
     """
     Defines the basic structure of an event.
     """
 
+    # events are created by the million: avoid a dictionary for each instance
+    __slots__ = ("event_time", "event_type", "destination", "source", "obj",
+                 "canceled", "queued")
+
     # start transmission event
     START_TX = 0
     # end transmission event
@@ -38,6 +42,10 @@ class Event:
     RX_TIMEOUT = 6
     # timeout for WT state: p-persistence implementation
     WT_TIMEOUT = 7
+    # beginning of a transmission, delivered by the channel to all receivers
+    START_BROADCAST = 8
+    # end of a transmission, delivered by the channel to all receivers
+    END_BROADCAST = 9
 
     def __init__(self, event_time, event_type, destination, source, obj=None):
         """
@@ -53,6 +61,10 @@ class Event:
         self.destination = destination
         self.source = source
         self.obj = obj
+        # set when the event is canceled: the simulator discards it lazily
+        self.canceled = False
+        # set while the event is in the queue of the simulator
+        self.queued = False
 
     def get_time(self):
         """
@@ -84,6 +96,33 @@ class Event:
         """
         return self.obj
 
+    def cancel(self):
+        """
+        Marks the event as canceled. The event stays in the queue of the
+        simulator and is discarded when it gets to the top
+        """
+        self.canceled = True
+
+    def is_canceled(self):
+        """
+        Returns whether the event has been canceled
+        """
+        return self.canceled
+
+    def set_queued(self, queued):
+        """
+        Marks the event as added to or removed from the queue of the simulator
+        :param queued: whether the event is in the queue
+        """
+        self.queued = queued
+
+    def is_queued(self):
+        """
+        Returns whether the event is in the queue of the simulator, i.e., it
+        has been scheduled and not yet popped
+        """
+        return self.queued
+
     def dump_event(self):
         """
         Prints the event in a human readable format
@@ -0,0 +1,284 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2017 Davide Pedranz <davide.pedranz@gmail.com>
+
+import sys
+import heapq
+import bisect
+import itertools
+
+
+class EventQueue:
+    """
+    Generic queue of events. The actual implementation is chosen depending on
+    the name specified in the configuration. Canceled events are not removed
+    immediately: they are only marked as canceled and discarded when they reach
+    the top of the queue. When canceled events become the majority of the
+    queue, the queue is compacted to keep its size bounded.
+    Events are stored as (time, sequence number, event) tuples. The sequence
+    number increases with each insertion, so that events with the same time
+    are returned in insertion order and events themselves are never compared
+    """
+
+    # binary heap
+    HEAP = "heap"
+    # calendar queue
+    CALENDAR = "calendar"
+
+    # minimum number of canceled events in the queue before compacting it
+    COMPACT_MIN = 1024
+
+    def __init__(self):
+        """
+        Constructor. Initializes the counters common to all implementations
+        """
+        # number of canceled events still sitting in the queue
+        self.canceled = 0
+        # total number of canceled events discarded when popped from the queue
+        self.skipped = 0
+        # number of times the queue has been compacted
+        self.compactions = 0
+        # generator of sequence numbers used to break ties between events
+        self.sequence = itertools.count()
+
+    @staticmethod
+    def create(name):
+        """
+        Instantiates the queue of events with the given name
+        :param name: either "heap" or "calendar"
+        :returns: an empty queue of events
+        """
+        if name == EventQueue.HEAP:
+            return HeapQueue()
+        elif name == EventQueue.CALENDAR:
+            return CalendarQueue()
+        else:
+            print("Event queue error: unimplemented event queue %s" % name)
+            sys.exit(1)
+
+    def push(self, event):
+        """
+        Adds a new event to the queue
+        :param event: the event to add
+        """
+        print("Event queue error: %s does not override push()" %
+              self.__class__.__name__)
+        sys.exit(1)
+
+    def pop(self):
+        """
+        Removes and returns the first event that has not been canceled. Raises
+        IndexError if the queue is empty
+        :returns: the first event in the queue
+        """
+        print("Event queue error: %s does not override pop()" %
+              self.__class__.__name__)
+        sys.exit(1)
+
+    def compact(self):
+        """
+        Removes all canceled events from the queue
+        """
+        print("Event queue error: %s does not override compact()" %
+              self.__class__.__name__)
+        sys.exit(1)
+
+    def cancel(self, event):
+        """
+        Marks an event in the queue as canceled
+        :param event: the event to cancel
+        """
+        event.cancel()
+        self.canceled += 1
+        if self.canceled >= self.COMPACT_MIN and \
+                self.canceled * 2 > len(self):
+            self.compact()
+            self.canceled = 0
+            self.compactions += 1
+
+    def __len__(self):
+        """
+        Returns the number of events in the queue, including the canceled ones
+        """
+        print("Event queue error: %s does not override __len__()" %
+              self.__class__.__name__)
+        sys.exit(1)
+
+
+class HeapQueue(EventQueue):
+    """
+    Queue of events implemented as a binary heap
+    """
+
+    def __init__(self):
+        EventQueue.__init__(self)
+        self.heap = []
+
+    def push(self, event):
+        heapq.heappush(self.heap,
+                       (event.get_time(), next(self.sequence), event))
+
+    def pop(self):
+        entry = heapq.heappop(self.heap)
+        while entry[2].is_canceled():
+            self.canceled -= 1
+            self.skipped += 1
+            entry = heapq.heappop(self.heap)
+        return entry[2]
+
+    def compact(self):
+        self.heap = [e for e in self.heap if not e[2].is_canceled()]
+        heapq.heapify(self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+
+class CalendarQueue(EventQueue):
+    """
+    Calendar queue (R. Brown, 1988). Events are hashed by time into an array of
+    buckets, each one covering a time interval of fixed width and holding a
+    sorted list of events. The array is read as a circular calendar: bucket i
+    holds the events of all the "years" falling into the interval
+    [i * width, (i + 1) * width) modulo the calendar length. The number of
+    buckets is doubled or halved as the queue grows or shrinks, and the width
+    is re-estimated from the separation of the first events in the queue,
+    giving amortized O(1) push and pop
+    """
+
+    # initial and minimum number of buckets
+    MIN_BUCKETS = 2
+    # initial width of a bucket (seconds)
+    INITIAL_WIDTH = 1e-3
+    # number of events sampled to estimate the width of a bucket
+    SAMPLE_SIZE = 25
+
+    def __init__(self):
+        EventQueue.__init__(self)
+        # number of events in the queue, including canceled ones
+        self.size = 0
+        # time of the last event popped from the queue
+        self.last_time = 0.0
+        self.setup(self.MIN_BUCKETS, self.INITIAL_WIDTH)
+
+    def setup(self, count, width):
+        """
+        Creates an empty calendar
+        :param count: number of buckets
+        :param width: time interval covered by each bucket
+        """
+        self.buckets = [[] for _ in range(count)]
+        self.count = count
+        self.width = width
+        # index of the current bucket, not reduced modulo the calendar length
+        self.current = int(self.last_time / width)
+        # thresholds for growing and shrinking the calendar
+        self.grow_size = 2 * count
+        self.shrink_size = count // 2 - 2
+
+    def push(self, event):
+        self.insert((event.get_time(), next(self.sequence), event))
+        if self.size > self.grow_size:
+            self.resize(self.count * 2)
+
+    def insert(self, entry):
+        """
+        Inserts an entry in its bucket
+        :param entry: (time, sequence number, event) tuple
+        """
+        bucket = self.buckets[int(entry[0] / self.width) % self.count]
+        bisect.insort(bucket, entry)
+        self.size += 1
+
+    def pop(self):
+        entry = self.remove_first()
+        while entry[2].is_canceled():
+            self.canceled -= 1
+            self.skipped += 1
+            entry = self.remove_first()
+        if self.size < self.shrink_size:
+            self.resize(self.count // 2)
+        return entry[2]
+
+    def remove_first(self):
+        """
+        Removes and returns the first entry of the calendar, canceled or not
+        :returns: the entry with the lowest time
+        """
+        if self.size == 0:
+            raise IndexError("pop from empty calendar queue")
+        # scan the buckets of the current year, starting from the current one
+        current = self.current
+        for _ in range(self.count):
+            bucket = self.buckets[current % self.count]
+            if bucket and int(bucket[0][0] / self.width) <= current:
+                return self.take(bucket, current)
+            current += 1
+        # all events are at least one year ahead: direct search for the
+        # bucket holding the earliest event
+        bucket = min((b for b in self.buckets if b), key=lambda b: b[0])
+        return self.take(bucket, int(bucket[0][0] / self.width))
+
+    def take(self, bucket, current):
+        """
+        Removes the first entry from a bucket and moves the calendar to it
+        :param bucket: the bucket
+        :param current: index of the bucket, not reduced modulo the length
+        :returns: the entry removed from the bucket
+        """
+        entry = bucket.pop(0)
+        self.size -= 1
+        self.current = current
+        self.last_time = entry[0]
+        return entry
+
+    def resize(self, count):
+        """
+        Rebuilds the calendar with a different number of buckets and a new
+        estimate of their width, dropping canceled events
+        :param count: the new number of buckets
+        """
+        count = max(count, self.MIN_BUCKETS)
+        entries = [e for b in self.buckets for e in b
+                   if not e[2].is_canceled()]
+        self.canceled = 0
+        self.setup(count, self.estimate_width(entries))
+        self.size = 0
+        for entry in entries:
+            self.insert(entry)
+
+    def estimate_width(self, entries):
+        """
+        Estimates the width of a bucket as three times the average separation
+        between the first events of the queue, ignoring separations larger
+        than twice the average
+        :param entries: the entries in the queue
+        :returns: the width of a bucket
+        """
+        sample = heapq.nsmallest(self.SAMPLE_SIZE, entries)
+        gaps = [b[0] - a[0] for (a, b) in zip(sample, sample[1:])]
+        if len(gaps) == 0:
+            return self.width
+        average = sum(gaps) / len(gaps)
+        gaps = [g for g in gaps if g <= 2 * average]
+        average = sum(gaps) / len(gaps)
+        if average <= 0:
+            return self.width
+        return 3 * average
+
+    def compact(self):
+        self.resize(self.count)
+
+    def __len__(self):
+        return self.size
@@ -15,9 +15,12 @@
 #
 # Modified by Davide Pedranz <davide.pedranz@gmail.com>
 
+import sys
 import sim
 from packet import Packet
-from utils import locate, mkdir_for_file
+from writers import CsvWriter, FrameWriter, BinaryWriter, MetricsWriter, \
+    AsyncWriter, CompressedFile, DEFAULT_LEVEL, DEFAULT_BLOCK_SIZE, \
+    open_output
 
 
 class Log:
@@ -39,32 +42,131 @@ class Log:
     LOG_QUEUE_SIZE = LOG_QUEUE_DROPPED + 1
     # use to log node state in time
     LOG_NODE_STATE = LOG_QUEUE_SIZE + 1
+    # list of the receivers of a node, logged before its first frame
+    LOG_RECEIVERS = LOG_NODE_STATE + 1
+    # outcomes of a transmitted frame at all its receivers
+    LOG_FRAME = LOG_RECEIVERS + 1
 
-    def __init__(self, output_file, log_packets=True, log_queue_drops=True,
-                 log_arrivals=True, log_queue_lengths=False, log_states=False):
+    # format of the output file parameter
+    PAR_FORMAT = "log_format"
+    # one line of text per record
+    CSV = "csv"
+    # fixed size binary records, see BinaryWriter
+    BINARY = "binary"
+    # summary of the records for each node, see MetricsWriter
+    METRICS = "metrics"
+    # as csv, but with a single line for each transmitted frame instead of one
+    # line for each receiver, see log_frame_outcome
+    FRAMES = "frames"
+    # extension of the output file for each format, before the compression
+    # one. the processing script recognizes the format by the extension
+    EXTENSIONS = {CSV: ".csv", BINARY: ".bin", METRICS: ".metrics",
+                  FRAMES: ".csv"}
+    # write the output file from a background thread parameter
+    PAR_ASYNC = "log_async"
+    # compression level parameter, for compressed output files
+    PAR_LEVEL = "log_compression_level"
+    # compression block size parameter, for compressed output files
+    PAR_BLOCK_SIZE = "log_block_size"
+    # parameters enabling or disabling each category of records
+    PAR_PACKETS = "log_packets"
+    PAR_QUEUE_DROPS = "log_queue_drops"
+    PAR_ARRIVALS = "log_arrivals"
+    PAR_QUEUE_LENGTHS = "log_queue_lengths"
+    PAR_STATES = "log_states"
+    # write the time spent by nodes in each state and with each queue length
+    # parameter, see log_occupancy
+    PAR_OCCUPANCY = "log_occupancy"
+    # suffix added to the output file name for the occupancy summary
+    OCCUPANCY_SUFFIX = ".occupancy"
+
+    def __init__(self, output_file, log_format=CSV, log_async=False,
+                 level=DEFAULT_LEVEL, block_size=DEFAULT_BLOCK_SIZE,
+                 log_packets=True, log_queue_drops=True, log_arrivals=True,
+                 log_queue_lengths=False, log_states=False,
+                 log_occupancy=False):
         """
         Constructor.
         :param output_file: output file name. will be overwritten if already
-        existing
+        existing. compressed if ending in .gz, .bz2 or .xz
+        :param log_format: format of the output file, either csv, binary,
+        metrics or frames
+        :param log_async: format and write records from a background thread
+        :param level: compression level, from 1 (fastest) to 9 (smallest)
+        :param block_size: amount of data passed to the compressor at once
         :param log_packets: enable/disable logging of packets
         (RECEIVED/CORRUPTED)
         :param log_queue_drops: enable/disable logging of packet drops
         :param log_arrivals: enable/disable logging of packet arrivals
         :param log_queue_lengths: enable/disable logging of queue lengths
         :param log_states: enable/disable logging of the state of nodes
+        :param log_occupancy: enable/disable the summary of the time spent by
+        nodes in each state and with each queue length
         """
         self.sim = sim.Sim.Instance()
+        self.output_file = output_file
         self.log_packets = log_packets
         self.log_queue_drops = log_queue_drops
         self.log_arrivals = log_arrivals
         self.log_queue_lengths = log_queue_lengths
         self.log_states = log_states
 
+        # frames still being received, only for the frames format: maps the
+        # id of the packet to a [source, packet, outcomes, number of missing
+        # outcomes] list
+        self.frames = {}
+        # maps the id of each node to a map from the ids of its receivers to
+        # their position in the outcomes of its frames
+        self.receivers = {}
+
+        # make sure the output file can be recognized by its extension
+        extension = Log.EXTENSIONS.get(log_format)
+        name = output_file
+        if CompressedFile.is_compressed(name):
+            name = name[:name.rindex(".")]
+        if extension is not None and not name.endswith(extension):
+            print("Log error: %s log files must have the %s extension (%s)" %
+                  (log_format, extension, output_file))
+            sys.exit(1)
+
         # open the file
-        path = locate(output_file)
-        mkdir_for_file(path)
-        self.log_file = open(path, "w")
-        self.log_file.write("time,src,dst,event,size\n")
+        if log_format == Log.CSV:
+            self.writer = CsvWriter(output_file, level, block_size)
+        elif log_format == Log.BINARY:
+            self.writer = BinaryWriter(output_file, level, block_size)
+        elif log_format == Log.METRICS:
+            self.writer = MetricsWriter(output_file, level, block_size)
+        elif log_format == Log.FRAMES:
+            self.writer = FrameWriter(output_file, level, block_size)
+            self.log_packet = self.log_frame_outcome
+        else:
+            print("Log error: unimplemented log format %s" % log_format)
+            sys.exit(1)
+        if log_async:
+            self.writer = AsyncWriter(self.writer)
+        self.write = self.writer.write
+
+        # disabled categories are bound to a method doing nothing, so that
+        # nodes do not pay for checking the flag at each event
+        if not log_packets:
+            self.log_packet = Log.ignore
+        if not log_queue_drops:
+            self.log_queue_drop = Log.ignore
+        if not log_arrivals:
+            self.log_arrival = Log.ignore
+        if not log_queue_lengths:
+            self.log_queue_length = Log.ignore
+        if not log_states:
+            self.log_state = Log.ignore
+        if not log_occupancy:
+            self.log_occupancy = Log.ignore
+
+    @staticmethod
+    def ignore(*args):
+        """
+        Replaces the methods logging the disabled categories of records
+        """
+        pass
 
     def log_packet(self, source, destination, packet):
         """
@@ -73,11 +175,59 @@ class Log:
         :param destination: destination node id
         :param packet: the packet to log
         """
-        if self.log_packets:
-            self.log_file.write("%f,%d,%d,%d,%d\n" %
-                                (self.sim.get_time(), source.get_id(),
-                                 destination.get_id(), packet.get_state(),
-                                 packet.get_size()))
+        self.write(self.sim.get_time(), source.get_id(),
+                   destination.get_id(), packet.get_state(),
+                   packet.get_size())
+
+    def log_frame_outcome(self, source, destination, reception):
+        """
+        Collects the result of a packet reception in the outcomes of the frame.
+        The frame is logged as a single record when the last receiver is done,
+        with one digit for each receiver: the state of the reception, or 0 if
+        the receiver has not logged it. Receivers are in the order listed by
+        the LOG_RECEIVERS record of the source. NB: unlike the other formats,
+        the source of frame records is the node transmitting the packet
+        :param source: source node (ignored, taken from the packet)
+        :param destination: destination node
+        :param reception: the reception to log
+        """
+        packet = reception.get_packet()
+        source = packet.get_source()
+        frame = self.frames.get(packet.get_id())
+        if frame is None:
+            if source.get_id() not in self.receivers:
+                self.log_receivers(source)
+            count = len(self.receivers[source.get_id()])
+            frame = [source, packet, bytearray(b"0" * count), count]
+            self.frames[packet.get_id()] = frame
+        position = self.receivers[source.get_id()][destination.get_id()]
+        frame[2][position] = ord("0") + reception.get_state()
+        frame[3] -= 1
+        if frame[3] == 0:
+            del self.frames[packet.get_id()]
+            self.log_frame(frame[0], frame[1], frame[2])
+
+    def log_receivers(self, source):
+        """
+        Logs the list of the receivers of a node, i.e., its neighbors
+        :param source: the node
+        """
+        neighbors = source.channel.neighbors[source.get_id()]
+        self.receivers[source.get_id()] = dict(
+            (n.get_id(), i) for (i, n) in enumerate(neighbors))
+        self.write(self.sim.get_time(), source.get_id(), source.get_id(),
+                   Log.LOG_RECEIVERS, len(neighbors),
+                   " ".join(str(n.get_id()) for n in neighbors))
+
+    def log_frame(self, source, packet, outcomes):
+        """
+        Logs a transmitted frame together with its outcomes
+        :param source: source node
+        :param packet: the packet
+        :param outcomes: the outcomes at the receivers
+        """
+        self.write(packet.get_start_time(), source.get_id(), source.get_id(),
+                   Log.LOG_FRAME, packet.get_size(), str(outcomes))
 
     def log_queue_drop(self, source, packet_size):
         """
@@ -85,11 +235,9 @@ class Log:
         :param source: source node
         :param packet_size: size of the packet being dropped
         """
-        if self.log_queue_drops:
-            self.log_file.write("%f,%d,%d,%d,%d\n" %
-                                (self.sim.get_time(), source.get_id(),
-                                 source.get_id(), Log.LOG_QUEUE_DROPPED,
-                                 packet_size))
+        self.write(self.sim.get_time(), source.get_id(),
+                   source.get_id(), Log.LOG_QUEUE_DROPPED,
+                   packet_size)
 
     def log_arrival(self, source, packet_size):
         """
@@ -97,11 +245,9 @@ class Log:
         :param source: source node
         :param packet_size: size of the packet being dropped
         """
-        if self.log_arrivals:
-            self.log_file.write("%f,%d,%d,%d,%d\n" %
-                                (self.sim.get_time(), source.get_id(),
-                                 source.get_id(), Log.LOG_GENERATED,
-                                 packet_size))
+        self.write(self.sim.get_time(), source.get_id(),
+                   source.get_id(), Log.LOG_GENERATED,
+                   packet_size)
 
     def log_queue_length(self, node, length):
         """
@@ -109,10 +255,8 @@ class Log:
         :param node: node
         :param length: length of the queue
         """
-        if self.log_queue_lengths:
-            self.log_file.write("%f,%d,%d,%d,%d\n" %
-                                (self.sim.get_time(), node.get_id(),
-                                 node.get_id(), Log.LOG_QUEUE_SIZE, length))
+        self.write(self.sim.get_time(), node.get_id(),
+                   node.get_id(), Log.LOG_QUEUE_SIZE, length)
 
     def log_state(self, node, state):
         """
@@ -120,7 +264,44 @@ class Log:
         :param node: node
         :param state: state of the node
         """
-        if self.log_states:
-            self.log_file.write("%f,%d,%d,%d,%d\n" %
-                                (self.sim.get_time(), node.get_id(),
-                                 node.get_id(), Log.LOG_NODE_STATE, state))
+        self.write(self.sim.get_time(), node.get_id(),
+                   node.get_id(), Log.LOG_NODE_STATE, state)
+
+    def log_occupancy(self, nodes):
+        """
+        Writes the summary of the time spent by each node in each state
+        ("state" lines) and with each length of its queue ("queue" lines) to
+        the output file name followed by OCCUPANCY_SUFFIX. Each line reports
+        the time and the fraction of the simulation time. A "mean_queue" line
+        per node reports the time-weighted mean of the queue length as value,
+        over the whole simulation time (fraction 1)
+        :param nodes: the nodes of the simulation
+        """
+        summary = open_output(self.output_file + Log.OCCUPANCY_SUFFIX)
+        summary.write("dst,kind,value,time,fraction\n")
+        total = self.sim.get_time()
+        for node in nodes:
+            node.account()
+            for (state, time) in enumerate(node.state_time):
+                summary.write("%d,state,%d,%f,%f\n" %
+                              (node.get_id(), state, time, time / total))
+            mean = 0.0
+            for length in sorted(node.queue_time.keys()):
+                time = node.queue_time[length]
+                summary.write("%d,queue,%d,%f,%f\n" %
+                              (node.get_id(), length, time, time / total))
+                mean += length * time / total
+            summary.write("%d,mean_queue,%f,%f,%f\n" %
+                          (node.get_id(), mean, total, 1.0))
+        summary.close()
+
+    def close(self):
+        """
+        Flushes and closes the output file, logging the frames whose reception
+        is not over yet
+        """
+        for packet_id in sorted(self.frames.keys()):
+            frame = self.frames[packet_id]
+            self.log_frame(frame[0], frame[1], frame[2])
+        self.frames = {}
+        self.writer.close()
@@ -0,0 +1,357 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2017 Davide Pedranz <davide.pedranz@gmail.com>
+
+import sys
+from distribution import Uniform, Exp
+from event import Event
+from packet import Packet
+
+
+class Mac:
+    """
+    Generic MAC protocol. Implements the part of the state machine of a node
+    that depends on the protocol, i.e., how the node reacts to the beginning
+    and the end of receptions and to the end of the processing time. The
+    protocol is chosen with the "mac" parameter of the configuration, which is
+    the name of the protocol optionally followed by the persistence, e.g.,
+    "aloha", "trivial", "simple" or "simple.0.25"
+    """
+
+    # Aloha
+    ALOHA = "aloha"
+    # Trivial Carrier Sensing
+    TRIVIAL = "trivial"
+    # Simple Carrier Sensing (p-persistence)
+    SIMPLE = "simple"
+
+    def __init__(self, node):
+        """
+        Constructor.
+        :param node: the node using this protocol
+        """
+        self.node = node
+
+    @staticmethod
+    def create(spec, node, persistence=""):
+        """
+        Instantiates the MAC protocol described by the given specification
+        :param spec: name of the protocol, optionally followed by the
+        persistence, e.g., "simple.0.25"
+        :param node: the node using the protocol
+        :param persistence: persistence parameter, used if not given in the
+        specification. giving it in both is an error, since the output file
+        name would describe the run twice
+        :returns: the MAC protocol
+        """
+        tokens = spec.split(".", 1)
+        name = tokens[0]
+        if len(tokens) == 2:
+            if persistence != "":
+                print("MAC error: persistence given both in %s and in the "
+                      "persistence parameter (%s)" % (spec, persistence))
+                sys.exit(1)
+            persistence = tokens[1]
+        if name == Mac.ALOHA:
+            return Aloha(node)
+        elif name == Mac.TRIVIAL:
+            return TrivialCarrierSensing(node)
+        elif name == Mac.SIMPLE:
+            if persistence == "":
+                print("MAC error: missing persistence for %s" % spec)
+                sys.exit(1)
+            return SimpleCarrierSensing(node, float(persistence))
+        else:
+            print("MAC error: unimplemented MAC protocol %s" % spec)
+            sys.exit(1)
+
+    def handle_start_rx(self, event):
+        """
+        Handles beginning of a frame reception
+        :param event: the RX event including the frame being received
+        """
+        print("MAC error: %s does not override handle_start_rx()" %
+              self.__class__.__name__)
+        sys.exit(1)
+
+    def handle_end_rx(self, event):
+        """
+        Handles the end of a reception
+        :param event: the END_RX event
+        """
+        print("MAC error: %s does not override handle_end_rx()" %
+              self.__class__.__name__)
+        sys.exit(1)
+
+    def handle_end_proc(self, event):
+        """
+        Handles the end of the processing period, resuming operations
+        :param event: the END_PROC event
+        """
+        print("MAC error: %s does not override handle_end_proc()" %
+              self.__class__.__name__)
+        sys.exit(1)
+
+    def check_state(self, state):
+        """
+        Checks the invariants of the protocol when the node changes state.
+        Protocols keeping some state of their own can override this method
+        :param state: the new state of the node
+        """
+        pass
+
+    def handle_wt_timeout(self, event):
+        """
+        Handles the end of the waiting time before a transmission. Only
+        protocols using the WT state need to override this method
+        :param event: the WT_TIMEOUT event
+        """
+        print("MAC error: %s can't handle WT_TIMEOUT events" %
+              self.__class__.__name__)
+        sys.exit(1)
+
+
+class Aloha(Mac):
+    """
+    Aloha: packets are transmitted as soon as the node is done with the
+    current transmission or reception, without looking at the channel
+    """
+
+    def handle_start_rx(self, event):
+        node = self.node
+        new_packet = event.get_obj()
+
+        # node is idle and the channel is free: it will try to receive this
+        # packet
+        if node.state == node.IDLE and node.receiving_count == 0:
+            node.receive_packet(new_packet)
+
+        # node is idle, but other frames are still in the air: the new packet
+        # collides with them
+        elif node.state == node.IDLE:
+            new_packet.set_state(Packet.PKT_CORRUPTED)
+
+        else:
+            # node is doing something
+            if node.state == node.RX and node.current_pkt is not None:
+                # the frame we are currently receiving is corrupted by a
+                # collision, if we have one
+                node.current_pkt.set_state(Packet.PKT_CORRUPTED)
+            # the same holds for the new incoming packet.
+            # if we are NOT in IDLE we won't be able to decode it
+            new_packet.set_state(Packet.PKT_CORRUPTED)
+
+        # in any case, we schedule a new event to handle the end of this frame
+        node.schedule_end_rx(new_packet)
+
+    def handle_end_rx(self, event):
+        node = self.node
+        packet = event.get_obj()
+
+        # if the packet that ends is the one that we are trying to receive, but
+        # we are not in the RX state, then something is very wrong
+        if node.current_pkt is not None and \
+                packet.get_id() == node.current_pkt.get_id():
+            assert (node.state == node.RX)
+
+        # ignore the packet if in some state other than RX
+        if node.state == node.RX:
+            node.end_reception(packet)
+
+        # remove packet from the channel
+        node.receiving_count -= 1
+
+        # log packet
+        node.logger.log_packet(event.get_source(), node, packet)
+
+    # noinspection PyUnusedLocal
+    def handle_end_proc(self, event):
+        node = self.node
+        assert (node.state == node.PROC)
+
+        if len(node.queue) == 0:
+            # resuming operations but nothing to transmit. back to IDLE
+            node.change_state(node.IDLE)
+        else:
+            # there is a packet ready, transmit it
+            node.dequeue_and_transmit_packer()
+
+
+class TrivialCarrierSensing(Aloha):
+    """
+    Trivial Carrier Sensing: after the processing time, if the channel is busy
+    the node waits for it to get free (WC) and then transmits immediately
+    """
+
+    def handle_start_rx(self, event):
+        node = self.node
+        # with carrier sensing, a node can be IDLE only if the channel is free
+        if node.state == node.IDLE:
+            assert node.receiving_count == 0
+        Aloha.handle_start_rx(self, event)
+
+    def handle_end_rx(self, event):
+        node = self.node
+
+        # with carrier sensing, this event should not happen in IDLE
+        # also, I am receiving at least one packet
+        assert (node.state != node.IDLE)
+        assert (node.receiving_count >= 1)
+
+        packet = event.get_obj()
+
+        # if the packet that ends is the one that we are trying to receive, but
+        # we are not in the RX state, then something is very wrong
+        if node.current_pkt is not None and \
+                packet.get_id() == node.current_pkt.get_id():
+            assert (node.state == node.RX)
+
+        # ignore the packet if in some state other than RX
+        if node.state == node.RX:
+            node.end_reception(packet)
+
+        # trivial carrier sensing
+        elif node.state == node.WC:
+
+            # if count = 1, I am receiving the last packet in the channel
+            # I can exit the carrier sensing and go either to IDLE of TX
+            if node.receiving_count == 1:
+                if len(node.queue) == 0:
+                    # resuming operations but nothing to transmit. back to IDLE
+                    node.change_state(node.IDLE)
+                else:
+                    # there is a packet ready, transmit it
+                    node.dequeue_and_transmit_packer()
+
+        # remove packet from the channel
+        node.receiving_count -= 1
+
+        # log packet
+        node.logger.log_packet(event.get_source(), node, packet)
+
+    def handle_end_proc(self, event):
+        node = self.node
+        assert (node.state == node.PROC)
+        assert (node.receiving_count >= 0)
+
+        # nothing in the air... IDLE / TX
+        if node.receiving_count == 0:
+            Aloha.handle_end_proc(self, event)
+
+        # something there... do carrier sensing
+        else:
+            self.wait_for_channel()
+
+    def wait_for_channel(self):
+        """
+        Waits for the channel to get free. NB: if nothing to transmit, the node
+        just waits for the channel to get free to then move to IDLE
+        """
+        self.node.change_state(self.node.WC)
+
+
+class SimpleCarrierSensing(TrivialCarrierSensing):
+    """
+    Simple Carrier Sensing: if the channel is busy, with probability p the node
+    waits a random exponential time (WT) before trying again, otherwise it
+    waits for the channel to get free (WC) and then transmits immediately
+    """
+
+    def __init__(self, node, persistence):
+        """
+        Constructor.
+        :param node: the node using this protocol
+        :param persistence: p-persistence probability
+        """
+        TrivialCarrierSensing.__init__(self, node)
+        # p-persistence probability [simple carrier sensing]
+        self.p_persistence = persistence
+        # timeout used for the p-persistence
+        self.timeout_wt_event = None
+
+    def handle_start_rx(self, event):
+        node = self.node
+
+        # I am waiting to transmit... but I can receive packets
+        # receive the packet only if it is the only one in the air
+        if node.state == node.WT and node.receiving_count == 0:
+
+            # delete the timeout
+            node.sim.cancel_event(self.timeout_wt_event)
+            self.timeout_wt_event = None
+
+            # receive the packet
+            node.receive_packet(event.get_obj())
+            node.schedule_end_rx(event.get_obj())
+
+        else:
+            TrivialCarrierSensing.handle_start_rx(self, event)
+
+    def check_state(self, state):
+        # the timeout can be pending only while waiting in the WT state
+        if state != self.node.WT:
+            assert self.timeout_wt_event is None
+
+    # noinspection PyUnusedLocal
+    def handle_wt_timeout(self, event):
+        node = self.node
+
+        # when this event happens, we can only be in WT state
+        # each time I move out from WT, I cancel the timeout
+        assert (node.state == node.WT)
+
+        # remove timeout from node
+        self.timeout_wt_event = None
+
+        # if the channel is free, I can transmit
+        if node.receiving_count == 0:
+            node.dequeue_and_transmit_packer()
+
+        # channel is NOT free... repeat the procedure
+        else:
+            self.schedule_packet_transmission()
+
+    def wait_for_channel(self):
+        if len(self.node.queue) == 0:
+            TrivialCarrierSensing.wait_for_channel(self)
+        else:
+            self.schedule_packet_transmission()
+
+    def schedule_packet_transmission(self):
+        """
+        Schedule the next packet transmission, using p-persistence.
+        p is the probability to transmit immediately after the
+        channel gets free (WC).
+        """
+        node = self.node
+        assert (len(node.queue) > 0)
+
+        # simple carrier sensing - p-persistence
+        # extract a random number from a uniform distribution
+        # if number >= p, else schedule transmission
+        # after exponential time
+        random = Uniform(0, 1).get_value()
+
+        # will transmit this packet immediately when channel gets free
+        if random >= self.p_persistence:
+            node.change_state(node.WC)
+
+        # wait random exponential time... then try again
+        # average time is 10 * time to send biggest packet allowed
+        else:
+            max_tx_time = Exp(node.packet_max_tx_time * 10).get_value()
+            self.timeout_wt_event = Event(node.sim.get_time() + max_tx_time,
+                                          Event.WT_TIMEOUT, node, node)
+            node.sim.schedule_event(self.timeout_wt_event)
+            node.change_state(node.WT)
@@ -19,9 +19,66 @@
 
 
 from optparse import OptionParser
+from multiprocessing import Pool, cpu_count
 import sys
 import sim
 
+
+def parse_runs(runs, runs_count):
+    """
+    Parses a list of runs given as comma separated run numbers or ranges of
+    run numbers, e.g., "0-9,15,20-21"
+    :param runs: the list of runs
+    :param runs_count: total number of runs in the configuration
+    :returns: the sorted list of run numbers
+    """
+    numbers = set()
+    try:
+        for token in runs.split(","):
+            bounds = token.split("-")
+            if len(bounds) == 1:
+                numbers.add(int(bounds[0]))
+            elif len(bounds) == 2:
+                numbers.update(range(int(bounds[0]), int(bounds[1]) + 1))
+            else:
+                raise ValueError(token)
+    except ValueError:
+        print("Invalid list of runs %s" % runs)
+        sys.exit(1)
+    for n in numbers:
+        if n < 0 or n >= runs_count:
+            print("Simulation error. Run number %d does not exist. Please run "
+                  "the simulator with the --list option to list all possible "
+                  "runs" % n)
+            sys.exit(1)
+    return sorted(numbers)
+
+
+class RunError(Exception):
+    """
+    Raised when a run stops the simulation with sys.exit()
+    """
+    pass
+
+
+def run_simulation(run_number):
+    """
+    Executes a single run of the simulation in the current process. The
+    simulator is reset by initialize(), so the same process can execute many
+    runs one after the other. Errors stopping the simulation with sys.exit()
+    are raised as RunError: a worker process of a Pool that exits never
+    returns the result of its task, and the main process would wait forever
+    :param run_number: the run to execute
+    """
+    simulator = sim.Sim.Instance()
+    try:
+        simulator.initialize(run_number)
+        simulator.run(verbose=False)
+    except SystemExit as e:
+        raise RunError("run %d stopped with exit code %s" %
+                       (run_number, e.code))
+
+
 # setup command line parameters
 parser = OptionParser(usage="usage: %prog [options]",
                       description="Runs a simulation configured in the "
@@ -32,9 +89,17 @@ parser.add_option("-l", "--list", dest="list", default=False,
 parser.add_option("-L", "--LIST", dest="verbose_list", default=False,
                   action="store_true", help="list the available runs with "
                                             "simulation parameters and exit")
-parser.add_option("-r", "--run", dest="run", default=0, action="store",
-                  help="run simulation number RUN [default: %default]",
-                  metavar="RUN", type="int")
+parser.add_option("-r", "--run", dest="run", default="0", action="store",
+                  help="run simulation number RUN. RUN can also be a comma "
+                       "separated list of runs or ranges of runs, e.g., "
+                       "0-9,15 [default: %default]",
+                  metavar="RUN")
+parser.add_option("-a", "--all", dest="all", default=False,
+                  action="store_true", help="run all the simulations")
+parser.add_option("-j", "--jobs", dest="jobs", default=cpu_count(),
+                  action="store", type="int",
+                  help="number of runs to execute in parallel when running "
+                       "more than one simulation [default: %default]")
 parser.add_option("-c", "--config", dest="config", default="config.json",
                   action="store",
                   help="simulation config file [default: %default]")
@@ -67,5 +132,40 @@ if options.list or options.verbose_list:
                    simulator.get_params(i)))
     sys.exit(0)
 
-simulator.initialize(options.run)
-simulator.run()
+# runs to execute
+if options.all:
+    runs = range(simulator.get_runs_count())
+else:
+    runs = parse_runs(options.run, simulator.get_runs_count())
+
+# a single run: show the progress of the simulation
+if len(runs) == 1:
+    simulator.initialize(runs[0])
+    simulator.run()
+    simulator.update_index(runs)
+    sys.exit(0)
+
+# many runs: each worker process loads the configuration once (inherited from
+# this process) and executes many runs one after the other
+try:
+    if options.jobs <= 1:
+        for run in runs:
+            run_simulation(run)
+    else:
+        pool = Pool(options.jobs)
+        try:
+            for _ in pool.imap_unordered(run_simulation, runs):
+                pass
+            pool.close()
+        except BaseException:
+            # stop the other runs if one of them fails
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+except RunError as e:
+    print("Simulation error. %s" % e)
+    sys.exit(1)
+
+# collect the metadata of all runs in the index of the output folder
+simulator.update_index(runs)
@@ -42,6 +42,14 @@ class Module:
         # get data logger from simulator
         self.logger = self.sim.get_logger()
 
+    @staticmethod
+    def reset_count():
+        """
+        Restarts the automatic assignment of module ids from 0. Used by the
+        simulator before initializing a new run
+        """
+        Module.__modules_count = 0
+
     def initialize(self):
         """
         Initialization method called by the simulation for each newly
@@ -17,9 +17,10 @@
 
 import sys
 from module import Module
-from distribution import Distribution, Uniform, Exp
+from distribution import Distribution, Uniform
 from event import Event
 from packet import Packet
+from mac import Mac
 
 
 class Node(Module):
@@ -41,6 +42,8 @@ class Node(Module):
     MAXSIZE = "maxsize"
     # type of propagation
     PROPAGATION = "propagation"
+    # MAC protocol
+    MAC = "mac"
     # p-persistence
     PERSISTENCE = "persistence"
 
@@ -73,6 +76,13 @@ class Node(Module):
         # current state
         self.state = Node.IDLE
         self.logger.log_state(self, Node.IDLE)
+        # time spent in each state and with each length of the queue. the time
+        # is accumulated when the state or the length changes, see
+        # change_state() and account_queue()
+        self.state_time = [0.0] * (Node.WT + 1)
+        self.state_since = self.sim.get_time()
+        self.queue_time = {}
+        self.queue_since = self.sim.get_time()
         # save position
         self.x = x
         self.y = y
@@ -84,12 +94,8 @@ class Node(Module):
         self.receiving_count = 0
         # timeout event used to avoid being stuck in the RX state
         self.timeout_rx_event = None
-        # timeout used for the p-persistence
-        self.timeout_wt_event = None
         # time needed to transmit a packet with the maximum size
         self.packet_max_tx_time = self.maxsize * 8.0 / self.datarate
-        # p-persistence probability [simple carrier sensing]
-        self.p_persistence = float(config.get_param(Node.PERSISTENCE))
         # timeout time for the rx timeout event. set as the time needed to
         # transmit a packet of the maximum size plus a small amount of 10
         # microseconds
@@ -97,6 +103,9 @@ class Node(Module):
         # determine the type of propagation..
         self.realistic_propagation = config.get_param(
             Node.PROPAGATION) == "realistic"
+        # MAC protocol, Simple Carrier Sensing by default
+        self.mac = Mac.create(config.get_param(Node.MAC, Mac.SIMPLE), self,
+                              config.get_param(Node.PERSISTENCE, ""))
 
     def initialize(self):
         """
@@ -123,17 +132,17 @@ class Node(Module):
         if event.get_type() == Event.PACKET_ARRIVAL:
             self.handle_arrival()
         elif event.get_type() == Event.START_RX:
-            self.handle_start_rx(event)
+            self.mac.handle_start_rx(event)
         elif event.get_type() == Event.END_RX:
-            self.handle_end_rx(event)
+            self.mac.handle_end_rx(event)
         elif event.get_type() == Event.END_TX:
             self.handle_end_tx(event)
         elif event.get_type() == Event.END_PROC:
-            self.handle_end_proc(event)
+            self.mac.handle_end_proc(event)
         elif event.get_type() == Event.RX_TIMEOUT:
             self.handle_rx_timeout(event)
         elif event.get_type() == Event.WT_TIMEOUT:
-            self.handle_wt_timeout(event)
+            self.mac.handle_wt_timeout(event)
         else:
             print("Node %d has received a notification for event type %d which"
                   " can't be handled", (self.get_id(), event.get_type()))
@@ -161,6 +170,7 @@ class Node(Module):
             # if we are doing something, packet must be queued
             if self.queue_size == 0 or len(self.queue) < self.queue_size:
                 # if queue size is infinite or there is still space
+                self.account_queue()
                 self.queue.append(packet_size)
                 self.logger.log_queue_length(self, len(self.queue))
             else:
@@ -170,129 +180,66 @@ class Node(Module):
         # schedule next arrival
         self.schedule_next_arrival()
 
-    def handle_start_rx(self, event):
+    def schedule_end_rx(self, packet):
         """
-        Handles beginning of a frame reception
-        :param event: the RX event including the frame being received
+        Schedules the end of the reception of a frame and counts it as
+        currently being received. If the channel coalesces the events of a
+        transmission, the channel notifies the end of the reception instead
+        :param packet: the frame being received
         """
-        new_packet = event.get_obj()
-
-        # node is idle: it will try to receive this packet
-        if self.state == Node.IDLE:
-
-            # with carrier sensing, this should be the only possibility
-            assert self.receiving_count == 0
-            self.receive_packet(new_packet)
-
-        # I am waiting to transmit... but I can receive packets
-        # receive the packet only if it is the only one in the air
-        elif self.state == Node.WT and self.receiving_count == 0:
-
-            # delete the timeout
-            self.sim.cancel_event(self.timeout_wt_event)
-            self.timeout_wt_event = None
-
-            # receive the packet
-            self.receive_packet(new_packet)
-
-        else:
-            # node is doing something
-            if self.state == Node.RX and self.current_pkt is not None:
-                # the frame we are currently receiving is corrupted by a
-                # collision, if we have one
-                self.current_pkt.set_state(Packet.PKT_CORRUPTED)
-            # the same holds for the new incoming packet.
-            # if we are NOT in IDLE we won't be able to decode it
-            new_packet.set_state(Packet.PKT_CORRUPTED)
-        # in any case, we schedule a new event to handle the end of this frame
-        end_rx = Event(self.sim.get_time() + new_packet.get_duration(),
-                       Event.END_RX, self, self, new_packet)
-        self.sim.schedule_event(end_rx)
-        # count this as currently being received
+        if not self.channel.coalesce:
+            end_rx = Event(self.sim.get_time() + packet.get_duration(),
+                           Event.END_RX, self, self, packet)
+            self.sim.schedule_event(end_rx)
         self.receiving_count += 1
 
-    def handle_end_rx(self, event):
+    def end_reception(self, packet):
         """
-        Handles the end of a reception
-        :param event: the END_RX event
+        Handles the end of a frame while in the RX state
+        :param packet: the frame whose reception is over
         """
+        if packet.get_state() == Packet.PKT_RECEIVING:
 
-        # with carrier sensing, this event should not happen in IDLE
-        # also, I am receiving at least one packet
-        assert (self.state != self.IDLE)
-        assert (self.receiving_count >= 1)
-
-        packet = event.get_obj()
-
-        # if the packet that ends is the one that we are trying to receive, but
-        # we are not in the RX state, then something is very wrong
-        if self.current_pkt is not None and \
-                packet.get_id() == self.current_pkt.get_id():
-            assert (self.state == Node.RX)
-
-        # ignore the packet if in some state other than RX
-        if self.state == Node.RX:
-            if packet.get_state() == Packet.PKT_RECEIVING:
-
-                # "Realistic Propagation" model
-                # if here, there was NO collision... the packet may be good
-                # extract: random ~ Unif(0,1)
-                if self.realistic_propagation:
-                    random = Uniform(0, 1).get_value()
-                    prob_correct = packet.get_prob_correct()
-
-                    if random >= prob_correct:
-                        # the packet is not in a corrupted state:
-                        # we successfully received it
-                        packet.set_state(Packet.PKT_RECEIVED)
-                    else:
-                        # we were unlucky: the channel corrupted the packet
-                        packet.set_state(Packet.PKT_CORRUPTED_BY_CHANNEL)
+            # "Realistic Propagation" model
+            # if here, there was NO collision... the packet may be good
+            # extract: random ~ Unif(0,1)
+            if self.realistic_propagation:
+                random = Uniform(0, 1).get_value()
+                prob_correct = packet.get_prob_correct()
 
-                # original propagation model
-                else:
+                if random >= prob_correct:
                     # the packet is not in a corrupted state:
                     # we successfully received it
                     packet.set_state(Packet.PKT_RECEIVED)
-
-                # just to be sure: we can only correctly receive the packet we
-                # were trying to decode
-                assert (packet.get_id() == self.current_pkt.get_id())
-
-            # we might be in RX state but have no current packet. this can
-            # happen when a packet overlaps with the current one being received
-            # and the one being received terminates earlier. we assume to stay
-            # in the RX state because we are not able to detect the end of the
-            # frame
-            if self.current_pkt is not None and \
-                    packet.get_id() == self.current_pkt.get_id():
-                self.current_pkt = None
-            if self.receiving_count == 1:
-                # this is the only frame currently in the air, move to PROC
-                # before restarting operations
-                self.switch_to_proc()
-                # delete the timeout event
-                self.sim.cancel_event(self.timeout_rx_event)
-                self.timeout_rx_event = None
-
-        # trivial carrier sensing
-        elif self.state == Node.WC:
-
-            # if count = 1, I am receiving the last packet in the channel
-            # I can exit the carrier sensing and go either to IDLE of TX
-            if self.receiving_count == 1:
-                if len(self.queue) == 0:
-                    # resuming operations but nothing to transmit. back to IDLE
-                    self.change_state(Node.IDLE)
                 else:
-                    # there is a packet ready, transmit it
-                    self.dequeue_and_transmit_packer()
-
-        # remove packet from the channel
-        self.receiving_count -= 1
+                    # we were unlucky: the channel corrupted the packet
+                    packet.set_state(Packet.PKT_CORRUPTED_BY_CHANNEL)
 
-        # log packet
-        self.logger.log_packet(event.get_source(), self, packet)
+            # original propagation model
+            else:
+                # the packet is not in a corrupted state:
+                # we successfully received it
+                packet.set_state(Packet.PKT_RECEIVED)
+
+            # just to be sure: we can only correctly receive the packet we
+            # were trying to decode
+            assert (packet.get_id() == self.current_pkt.get_id())
+
+        # we might be in RX state but have no current packet. this can
+        # happen when a packet overlaps with the current one being received
+        # and the one being received terminates earlier. we assume to stay
+        # in the RX state because we are not able to detect the end of the
+        # frame
+        if self.current_pkt is not None and \
+                packet.get_id() == self.current_pkt.get_id():
+            self.current_pkt = None
+        if self.receiving_count == 1:
+            # this is the only frame currently in the air, move to PROC
+            # before restarting operations
+            self.switch_to_proc()
+            # delete the timeout event
+            self.sim.cancel_event(self.timeout_rx_event)
+            self.timeout_rx_event = None
 
     # noinspection PyUnusedLocal
     def handle_rx_timeout(self, event):
@@ -322,61 +269,6 @@ class Node(Module):
         # the only thing to do here is to move to the PROC state
         self.switch_to_proc()
 
-    # noinspection PyUnusedLocal
-    def handle_end_proc(self, event):
-        """
-        Handles the end of the processing period, resuming operations
-        :param event: the END_PROC event
-        """
-        assert (self.state == Node.PROC)
-        assert (self.receiving_count >= 0)
-        assert (len(self.queue) >= 0)
-
-        # nothing in the air... IDLE / TX
-        if self.receiving_count == 0:
-            if len(self.queue) == 0:
-                # resuming operations but nothing to transmit. back to IDLE
-                self.change_state(Node.IDLE)
-            else:
-                # there is a packet ready, transmit it
-                packet_size = self.queue.pop(0)
-                self.transmit_packet(packet_size)
-                self.change_state(Node.TX)
-                self.logger.log_queue_length(self, len(self.queue))
-
-        # something there... do carrier sensing... WC or WT
-        else:
-            # NB: if nothing to transmit, just wait for the channel to get free
-            # to then move to IDLE
-            if len(self.queue) == 0:
-                self.change_state(Node.WC)
-            else:
-                self.schedule_packet_transmission()
-
-    # noinspection PyUnusedLocal
-    def handle_wt_timeout(self, event):
-        """
-        Handles the end of the processing period, resuming operations
-        :param event: the WT_TIMEOUT event
-        """
-
-        # when this event happens, we can only be in WT state
-        # each time I move out from WT, I cancel the timeout
-        assert (self.state == Node.WT)
-
-        # remove timeout from node
-        self.timeout_wt_event = None
-
-        # if the channel is free, I can transmit
-        if self.receiving_count == 0:
-            self.dequeue_and_transmit_packer()
-
-        # channel is NOT free... repeat the procedure
-        else:
-            self.schedule_packet_transmission()
-
-        pass
-
     def switch_to_proc(self):
         """
         Switches to the processing state and schedules the end_proc event
@@ -410,7 +302,7 @@ class Node(Module):
         assert (self.current_pkt is None)
         duration = packet_size * 8 / self.datarate
         # transmit packet
-        packet = Packet(packet_size, duration)
+        packet = Packet(packet_size, duration, self, self.sim.get_time())
         self.channel.start_transmission(self, packet)
         # schedule end of transmission
         end_tx = Event(self.sim.get_time() + duration, Event.END_TX, self,
@@ -423,48 +315,46 @@ class Node(Module):
         Utility method to transmit the next packet in the queue.
         """
         assert (len(self.queue) > 0)
+        self.account_queue()
         packet_size = self.queue.pop(0)
         self.transmit_packet(packet_size)
         self.change_state(Node.TX)
         self.logger.log_queue_length(self, len(self.queue))
 
-    def schedule_packet_transmission(self):
-        """
-        Schedule the next packet transmission, using p-persistence.
-        p is the probability to transmit immediately after the
-        channel gets free (WC).
-        """
-        assert (len(self.queue) > 0)
-
-        # simple carrier sensing - p-persistence
-        # extract a random number from a uniform distribution
-        # if number >= p, else schedule transmission
-        # after exponential time
-        random = Uniform(0, 1).get_value()
-
-        # will transmit this packet immediately when channel gets free
-        if random >= self.p_persistence:
-            self.change_state(Node.WC)
-
-        # wait random exponential time... then try again
-        # average time is 10 * time to send biggest packet allowed
-        else:
-            max_tx_time = Exp(self.packet_max_tx_time * 10).get_value()
-            self.timeout_wt_event = Event(self.sim.get_time() + max_tx_time,
-                                          Event.WT_TIMEOUT, self, self)
-            self.sim.schedule_event(self.timeout_wt_event)
-            self.change_state(Node.WT)
-
     def change_state(self, state):
         """
         Utility method to change the state of this node.
         :param state: New state to set.
         """
-        if state != Node.WT:
-            assert self.timeout_wt_event is None
+        self.mac.check_state(state)
+        now = self.sim.get_time()
+        self.state_time[self.state] += now - self.state_since
+        self.state_since = now
         self.state = state
         self.logger.log_state(self, state)
 
+    def account_queue(self):
+        """
+        Accounts for the time spent with the current length of the queue. Must
+        be called right before the length changes
+        """
+        now = self.sim.get_time()
+        length = len(self.queue)
+        self.queue_time[length] = self.queue_time.get(length, 0.0) + \
+            now - self.queue_since
+        self.queue_since = now
+
+    def account(self):
+        """
+        Accounts for the time spent in the current state and with the current
+        length of the queue, up to the current time. Used at the end of the
+        simulation, before reading state_time and queue_time
+        """
+        now = self.sim.get_time()
+        self.state_time[self.state] += now - self.state_since
+        self.state_since = now
+        self.account_queue()
+
     def get_posx(self):
         """
         Returns x position
@@ -33,19 +33,30 @@ class Packet:
     # packet has been corrupted by the channel during transmission
     PKT_CORRUPTED_BY_CHANNEL = 3
 
-    def __init__(self, size, duration):
+    def __init__(self, size, duration, source=None, start_time=0):
         """
         Creates a packet automatically assigning a unique ID to it
         :param size: size of the packet in bytes
         :param duration: packet duration in seconds
+        :param source: node transmitting the packet
+        :param start_time: time when the transmission of the packet starts
         """
         self.size = size
         self.duration = duration
+        self.source = source
+        self.start_time = start_time
         self.state = Packet.PKT_RECEIVING
         self.id = Packet.__packets_count
-        self.prob_correct = 1
         Packet.__packets_count += 1
 
+    @staticmethod
+    def reset_count():
+        """
+        Restarts the automatic assignment of packet ids from 0. Used by the
+        simulator before initializing a new run
+        """
+        Packet.__packets_count = 0
+
     def get_id(self):
         """
         Returns packet id
@@ -81,22 +92,19 @@ class Packet:
         """
         return self.duration
 
-    def get_prob_correct(self):
+    def get_source(self):
         """
-        Return the probability of correct receive this packet if there is no
-        collision, according to the "Realistic propagation" model.
-        NB: this probability is set by the CHANNEL.
-        :return: Probability of correct receiving this packet (if no collisions)
+        Returns the node transmitting the packet
+        :returns: source node
         """
-        assert self.prob_correct is not None
-        return self.prob_correct
+        return self.source
 
-    def set_prob_correct(self, prob_correct):
+    def get_start_time(self):
         """
-        Set the probability of correct receive this packet if there is no
-        collision. This probability is set by the CHANNEL.
+        Returns the time when the transmission of the packet started
+        :returns: start time in seconds
         """
-        self.prob_correct = prob_correct
+        return self.start_time
 
     def dump_packet(self):
         """
@@ -109,3 +117,79 @@ class Packet:
         elif self.state == Packet.PKT_CORRUPTED:
             t = "CORRUPTED"
         print("Packet state: %s\n\n" % t)
+
+
+class Reception(object):
+    """
+    Reception of a packet at a single receiver. Different receivers process the
+    same packet in different ways: one node might be able to receive it, one
+    node might not. Instead of copying the packet for each receiver, the
+    channel creates a reception that shares the immutable data of the packet
+    and holds the state of the reception at the receiver
+    """
+
+    # receptions are created for each neighbor of each transmission
+    __slots__ = ("packet", "state", "prob_correct")
+
+    def __init__(self, packet, prob_correct):
+        """
+        Creates a reception in the PKT_RECEIVING state
+        :param packet: the packet being received
+        :param prob_correct: probability of correct reception if there is no
+        collision, according to the "Realistic propagation" model
+        """
+        self.packet = packet
+        self.state = Packet.PKT_RECEIVING
+        self.prob_correct = prob_correct
+
+    def get_id(self):
+        """
+        Returns the id of the packet
+        :returns: id of the packet
+        """
+        return self.packet.id
+
+    def get_state(self):
+        """
+        Returns state of the reception
+        :returns: state of the reception
+        """
+        return self.state
+
+    def set_state(self, state):
+        """
+        Sets reception state.
+        :param state: either PKT_RECEIVING, PKT_RECEIVED, PKT_CORRUPTED or
+        PKT_CORRUPTED_BY_CHANNEL
+        """
+        self.state = state
+
+    def get_size(self):
+        """
+        Returns packet size
+        :returns: packet size in bytes
+        """
+        return self.packet.size
+
+    def get_duration(self):
+        """
+        Returns packet duration
+        :returns: packet duration in seconds
+        """
+        return self.packet.duration
+
+    def get_packet(self):
+        """
+        Returns the packet being received
+        :returns: the packet shared by all receptions of the transmission
+        """
+        return self.packet
+
+    def get_prob_correct(self):
+        """
+        Return the probability of correct receive this packet if there is no
+        collision, according to the "Realistic propagation" model.
+        NB: this probability is set by the CHANNEL.
+        :return: Probability of correct receiving this packet (if no collisions)
+        """
+        return self.prob_correct
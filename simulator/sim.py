@@ -15,16 +15,23 @@
 #
 # Modified by Davide Pedranz <davide.pedranz@gmail.com>
 
+import os
 import sys
-import heapq
+import json
 import random
 import time
 import math
+from collections import OrderedDict
 from singleton import Singleton
 from config import Config
 from channel import Channel
 from node import Node
 from log import Log
+from writers import DEFAULT_LEVEL, DEFAULT_BLOCK_SIZE
+from event_queue import EventQueue
+from module import Module
+from packet import Packet
+from utils import locate
 
 # VT100 command for erasing content of the current prompt line
 ERASE_LINE = '\x1b[2K'
@@ -44,26 +51,53 @@ class Sim:
     PAR_DURATION = "duration"
     # seed for PRNGs
     PAR_SEED = "seed"
-    # position of the nodes
+    # position of the nodes: either a list of x,y pairs or a random topology
+    # {"count": nodes, "width": meters, "height": meters}
     PAR_NODES = "nodes"
+    # number of nodes of a random topology
+    PAR_COUNT = "count"
+    # size of the area of a random topology
+    PAR_WIDTH = "width"
+    PAR_HEIGHT = "height"
+    # implementation of the queue of events
+    PAR_EVENT_QUEUE = "event_queue"
+    # write the metadata of each run next to its log file parameter
+    PAR_METADATA = "metadata"
+    # suffix added to the output file name for the metadata of the run
+    METADATA_SUFFIX = ".json"
+    # index of the runs, written in each output folder
+    INDEX_FILE = "index.json"
 
     def __init__(self):
         """
         Constructor initializing current time to 0 and the queue of events to
         empty
         """
+        # bring the simulator to its initial state
+        self.reset()
+        # empty config file
+        self.config_file = ""
+        # empty section
+        self.section = ""
+
+    def reset(self):
+        """
+        Brings the simulator back to its initial state, so that a new run can
+        be initialized in the same process
+        """
         # current simulation time
         self.time = 0
-        # queue of events, implemented as a heap
-        self.queue = []
+        # queue of events, instantiated by initialize()
+        self.queue = None
+        # number of events processed during the simulation
+        self.events_count = 0
         # list of nodes
         self.nodes = []
         # initialize() should be called before running the simulation
         self.initialized = False
-        # empty config file
-        self.config_file = ""
-        # empty section
-        self.section = ""
+        # module and packet ids restart from 0 in each run
+        Module.reset_count()
+        Packet.reset_count()
 
     def set_config(self, config_file, section):
         """
@@ -95,6 +129,8 @@ class Sim:
         if self.config_file == "" or self.section == "":
             print("Configuration error. Call set_config() before initialize()")
             sys.exit(1)
+        # clean up the state left by a previous run, if any
+        self.reset()
         # set and check run number
         self.run_number = run_number
         if run_number >= self.config.get_runs_count():
@@ -103,8 +139,22 @@ class Sim:
                   "runs" % run_number)
             sys.exit(1)
         self.config.set_run_number(run_number)
+        # instantiate the queue of events
+        self.queue = EventQueue.create(self.config.get_param(
+            self.PAR_EVENT_QUEUE, EventQueue.HEAP))
         # instantiate data logger
-        self.logger = Log(self.config.get_output_file())
+        self.logger = Log(self.config.get_output_file(),
+                          self.config.get_param(Log.PAR_FORMAT, Log.CSV),
+                          self.config.get_param(Log.PAR_ASYNC, False),
+                          self.config.get_param(Log.PAR_LEVEL, DEFAULT_LEVEL),
+                          self.config.get_param(Log.PAR_BLOCK_SIZE,
+                                                DEFAULT_BLOCK_SIZE),
+                          self.config.get_param(Log.PAR_PACKETS, True),
+                          self.config.get_param(Log.PAR_QUEUE_DROPS, True),
+                          self.config.get_param(Log.PAR_ARRIVALS, True),
+                          self.config.get_param(Log.PAR_QUEUE_LENGTHS, False),
+                          self.config.get_param(Log.PAR_STATES, False),
+                          self.config.get_param(Log.PAR_OCCUPANCY, False))
         # get simulation duration
         self.duration = self.config.get_param(self.PAR_DURATION)
         # get seeds. each seed generates a simulation repetition
@@ -114,6 +164,8 @@ class Sim:
         self.channel = Channel(self.config)
         # instantiate all the nodes
         positions = self.config.get_param(self.PAR_NODES)
+        if isinstance(positions, dict):
+            positions = self.random_positions(positions)
         for p in positions:
             x = p[0]
             y = p[1]
@@ -125,6 +177,22 @@ class Sim:
         # all done. simulation can start now
         self.initialized = True
 
+    def random_positions(self, topology):
+        """
+        Places nodes uniformly at random in a rectangular area
+        :param topology: {"count": nodes, "width": meters, "height": meters}
+        :returns: list of x,y pairs
+        """
+        try:
+            count = topology[self.PAR_COUNT]
+            width = topology[self.PAR_WIDTH]
+            height = topology[self.PAR_HEIGHT]
+        except KeyError as e:
+            print("Configuration error. Random topology without %s" % e)
+            sys.exit(1)
+        return [(random.uniform(0, width), random.uniform(0, height))
+                for _ in range(count)]
+
     def get_logger(self):
         """
         Returns the data logger to modules
@@ -150,35 +218,40 @@ class Sim:
                                 self.time,
                                 event.get_time()))
             sys.exit(1)
-        heapq.heappush(self.queue, (event.get_time(), event))
+        event.set_queued(True)
+        self.queue.push(event)
 
     def next_event(self):
         """
-        Returns the first event in the queue
+        Returns the first event in the queue, skipping canceled events
         """
         try:
-            event = heapq.heappop(self.queue)
-            self.time = event[0]
-            return event[1]
+            event = self.queue.pop()
+            event.set_queued(False)
+            self.time = event.get_time()
+            return event
         except IndexError:
             print("No more events in the simulation queue. Terminating.")
             sys.exit(0)
 
     def cancel_event(self, event):
         """
-        Deletes a scheduled event from the queue
+        Deletes a scheduled event from the queue. The event is only marked as
+        canceled and discarded when it reaches the top of the queue. Events
+        already popped from the queue, including the one being handled, can
+        not be canceled
         :param event: the event to be canceled
         """
-        try:
-            self.queue.remove((event.get_time(), event))
-            heapq.heapify(self.queue)
-        except ValueError:
+        if event.is_canceled() or not event.is_queued():
             print("Trying to delete an event that does not exist.")
             sys.exit(1)
+        self.queue.cancel(event)
 
-    def run(self):
+    def run(self, verbose=True):
         """
         Runs the simulation.
+        :param verbose: print a progress bar and detailed statistics. If False,
+        print a single line when the simulation is completed
         """
         # first check that everything is ready
         if not self.initialized:
@@ -189,28 +262,116 @@ class Sim:
         # last time we printed the simulation percentage
         prev_time = start_time
         # print percentage for the first time (0%)
-        self.print_percentage(True)
+        if verbose:
+            self.print_percentage(True)
         # main simulation loop
         while self.time <= self.duration:
             # get next event and call the handle method of the destination
             event = self.next_event()
             dst = event.get_destination()
             dst.handle_event(event)
+            self.events_count += 1
             # get current real time
             curr_time = time.time()
             # if more than a second has elapsed, update the percentage bar
-            if curr_time - prev_time >= 1:
+            if verbose and curr_time - prev_time >= 1:
                 self.print_percentage(False)
                 prev_time = curr_time
-        # simulation completed, print the percentage for the last time (100%)
-        self.print_percentage(False)
+        # all data has been logged
+        self.logger.log_occupancy(self.nodes)
+        self.logger.close()
         # compute how much time the simulation took
         end_time = time.time()
+        if self.config.get_param(self.PAR_METADATA, True):
+            self.write_metadata(end_time - start_time)
         total_time = round(end_time - start_time)
+        if not verbose:
+            print("Run %d completed in %d seconds (%d events)" %
+                  (self.run_number, total_time, self.events_count))
+            return
+        # simulation completed, print the percentage for the last time (100%)
+        self.print_percentage(False)
         print("\nMaximum simulation time reached. Terminating.")
         print("Total simulation time: %d hours, %d minutes, %d seconds" %
               (total_time / 3600, total_time % 3600 / 60,
                total_time % 3600 % 60))
+        print("Events processed: %d (%d events per second)" %
+              (self.events_count,
+               self.events_count / max(end_time - start_time, 1e-6)))
+        print("Canceled events skipped: %d, queue compactions: %d" %
+              (self.queue.skipped, self.queue.compactions))
+
+    def write_metadata(self, wall_time):
+        """
+        Writes the metadata of the run to the output file name followed by
+        METADATA_SUFFIX: run number, hash of the configuration, values of all
+        parameters, number of events, simulation time and wall time
+        :param wall_time: time taken by the run (seconds)
+        """
+        output_file = self.config.get_output_file()
+        metadata = OrderedDict([
+            ("file", os.path.basename(output_file)),
+            ("run", self.run_number),
+            ("config_hash", self.config.get_hash()),
+            ("events", self.events_count),
+            ("sim_time", self.time),
+            ("wall_time", wall_time),
+            ("params", OrderedDict(sorted(
+                self.config.get_run_params().items())))
+        ])
+        with open(locate(output_file) + self.METADATA_SUFFIX, "w") as f:
+            json.dump(metadata, f, sort_keys=False)
+
+    def update_index(self, runs):
+        """
+        Collects the metadata of some runs in the index of their output folder
+        (INDEX_FILE), replacing the entries of older runs with the same log
+        file. The index is a list with one entry for each log file, holding
+        the metadata of the run and the values of its parameters, except
+        lists. Nested parameters are flattened, e.g., interarrival.lambda is
+        stored as interarrival_lambda
+        :param runs: run numbers
+        """
+        folders = {}
+        for run in runs:
+            self.config.set_run_number(run)
+            path = locate(self.config.get_output_file())
+            if not os.path.isfile(path + self.METADATA_SUFFIX):
+                continue
+            with open(path + self.METADATA_SUFFIX) as f:
+                metadata = json.load(f, object_pairs_hook=OrderedDict)
+            entry = OrderedDict((k, v) for (k, v) in metadata.items()
+                                if k != "params")
+            entry.update(self.flatten(metadata["params"]))
+            folders.setdefault(os.path.dirname(path), {})[entry["file"]] = \
+                entry
+        for (folder, entries) in folders.items():
+            index_file = os.path.join(folder, self.INDEX_FILE)
+            index = {}
+            if os.path.isfile(index_file):
+                with open(index_file) as f:
+                    for entry in json.load(f, object_pairs_hook=OrderedDict):
+                        index[entry["file"]] = entry
+            index.update(entries)
+            with open(index_file, "w") as f:
+                json.dump([index[k] for k in sorted(index.keys())], f,
+                          indent=0)
+
+    def flatten(self, params, prefix=""):
+        """
+        Flattens nested parameters, skipping lists
+        :param params: map from parameter name to value
+        :param prefix: prefix of the names of the parameters
+        :returns: map from flattened parameter name to value
+        """
+        flat = OrderedDict()
+        for name in sorted(params.keys()):
+            value = params[name]
+            if isinstance(value, dict):
+                flat.update(self.flatten(value, prefix + name + "_"))
+            elif not isinstance(value, list):
+                flat[prefix + name] = value
+        return flat
 
     def print_percentage(self, first):
         # go back to the beginning of the line
@@ -14,6 +14,7 @@
 # Copyright (C) 2017 Davide Pedranz <davide.pedranz@gmail.com>
 
 import os
+import errno
 
 
 def locate(relative):
@@ -33,5 +34,9 @@ def mkdir_for_file(path):
     :param path: Path ot file.
     """
     directory = os.path.dirname(path)
-    if not os.path.exists(directory):
+    try:
         os.makedirs(directory)
+    except OSError as e:
+        # NB: the runs executed in parallel may create it at the same time
+        if e.errno != errno.EEXIST:
+            raise
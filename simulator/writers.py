@@ -0,0 +1,413 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright (C) 2017 Davide Pedranz <davide.pedranz@gmail.com>
+
+import sys
+import atexit
+import bz2
+import gzip
+import struct
+import threading
+import weakref
+from Queue import Queue
+from utils import locate, mkdir_for_file
+
+# xz compression needs the lzma module, which is not part of Python 2
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+# default compression level of compressed output files
+DEFAULT_LEVEL = 6
+# default amount of data passed to the compressor at once (bytes)
+DEFAULT_BLOCK_SIZE = 1 << 20
+
+
+class CompressedFile:
+    """
+    Output file compressed as a stream. The compression algorithm is chosen by
+    the extension of the file name: .gz (gzip), .bz2 (bzip2) or .xz (xz).
+    Data is collected in memory and passed to the compressor in blocks, since
+    compressing many short lines one at a time is very slow
+    """
+
+    # supported extensions of compressed files
+    EXTENSIONS = (".gz", ".bz2", ".xz")
+
+    def __init__(self, path, level=DEFAULT_LEVEL,
+                 block_size=DEFAULT_BLOCK_SIZE):
+        """
+        Constructor.
+        :param path: path of the file. will be overwritten if already existing
+        :param level: compression level, from 1 (fastest) to 9 (smallest)
+        :param block_size: amount of data passed to the compressor at once
+        """
+        if path.endswith(".gz"):
+            self.stream = gzip.GzipFile(path, "wb", level)
+        elif path.endswith(".bz2"):
+            self.stream = bz2.BZ2File(path, "wb", 0, level)
+        elif path.endswith(".xz"):
+            if lzma is None:
+                print("Log error: xz compression needs the lzma module "
+                      "(pip install backports.lzma)")
+                sys.exit(1)
+            self.stream = lzma.LZMAFile(path, "wb", preset=level)
+        else:
+            print("Log error: unknown compression for %s" % path)
+            sys.exit(1)
+        self.block_size = block_size
+        self.buffer = bytearray()
+
+    @staticmethod
+    def is_compressed(path):
+        """
+        Checks if a file should be compressed
+        :param path: path of the file
+        :returns: True if the extension of the file is a compressed one
+        """
+        return path.endswith(CompressedFile.EXTENSIONS)
+
+    def write(self, data):
+        """
+        Appends data to the file, compressing a block when the buffer is full
+        :param data: string or buffer to write
+        """
+        self.buffer += data
+        if len(self.buffer) >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Compresses the buffered data
+        """
+        self.stream.write(bytes(self.buffer))
+        del self.buffer[:]
+
+    def close(self):
+        """
+        Compresses the buffered data and closes the file
+        """
+        self.flush()
+        self.stream.close()
+
+
+def open_output(output_file, level=DEFAULT_LEVEL,
+                block_size=DEFAULT_BLOCK_SIZE, binary=False):
+    """
+    Opens an output file, creating its folder if needed. The file is compressed
+    if its name ends with one of the extensions of CompressedFile
+    :param output_file: output file name. will be overwritten if already
+    existing
+    :param level: compression level, from 1 (fastest) to 9 (smallest)
+    :param block_size: amount of data passed to the compressor at once
+    :param binary: open a plain file in binary mode
+    :returns: the file object
+    """
+    path = locate(output_file)
+    mkdir_for_file(path)
+    if CompressedFile.is_compressed(path):
+        return CompressedFile(path, level, block_size)
+    return open(path, "wb" if binary else "w")
+
+
+class CsvWriter:
+    """
+    Writes log records as lines of a CSV file
+    """
+
+    def __init__(self, output_file, level=DEFAULT_LEVEL,
+                 block_size=DEFAULT_BLOCK_SIZE):
+        """
+        Constructor.
+        :param output_file: output file name. will be overwritten if already
+        existing
+        :param level: compression level, for compressed files
+        :param block_size: compression block size, for compressed files
+        """
+        self.log_file = open_output(output_file, level, block_size)
+        self.log_file.write("time,src,dst,event,size\n")
+
+    def write(self, time, src, dst, event, size):
+        """
+        Writes a log record
+        :param time: simulation time
+        :param src: id of the source node
+        :param dst: id of the destination node
+        :param event: type of the record
+        :param size: packet size, queue length or node state
+        """
+        self.log_file.write("%f,%d,%d,%d,%d\n" % (time, src, dst, event, size))
+
+    def close(self):
+        """
+        Flushes and closes the output file
+        """
+        self.log_file.close()
+
+
+class FrameWriter(CsvWriter):
+    """
+    Writes log records as lines of a CSV file with an additional column, used
+    by frame records to store the outcome of a transmitted frame at each
+    receiver (see Log.FRAMES). The column is empty for all other records
+    """
+
+    def __init__(self, output_file, level=DEFAULT_LEVEL,
+                 block_size=DEFAULT_BLOCK_SIZE):
+        """
+        Constructor.
+        :param output_file: output file name. will be overwritten if already
+        existing
+        :param level: compression level, for compressed files
+        :param block_size: compression block size, for compressed files
+        """
+        self.log_file = open_output(output_file, level, block_size)
+        self.log_file.write("time,src,dst,event,size,outcomes\n")
+
+    def write(self, time, src, dst, event, size, outcomes=""):
+        """
+        Writes a log record
+        :param time: simulation time
+        :param src: id of the source node
+        :param dst: id of the destination node
+        :param event: type of the record
+        :param size: packet size, queue length or node state
+        :param outcomes: outcomes of a frame, only for frame records
+        """
+        self.log_file.write("%f,%d,%d,%d,%d,%s\n" %
+                            (time, src, dst, event, size, outcomes))
+
+
+class BinaryWriter:
+    """
+    Writes log records to a binary file made of a short header followed by
+    fixed size little endian records (float64 time, int32 src, int32 dst, int8
+    event, int32 size), without padding. The file can be memory-mapped as a
+    NumPy record array. Records are packed into a buffer in memory, which is
+    written to the file in large blocks
+    """
+
+    # header of the file, identifies the format and its version
+    MAGIC = b"SIMLOG01"
+    # layout of a single record
+    RECORD = struct.Struct("<diibi")
+    # number of records written to the file at once
+    BLOCK = 65536
+
+    def __init__(self, output_file, level=DEFAULT_LEVEL,
+                 block_size=DEFAULT_BLOCK_SIZE):
+        """
+        Constructor.
+        :param output_file: output file name. will be overwritten if already
+        existing
+        :param level: compression level, for compressed files
+        :param block_size: compression block size, for compressed files
+        """
+        self.log_file = open_output(output_file, level, block_size, True)
+        self.log_file.write(BinaryWriter.MAGIC)
+        # buffer of records not yet written to the file
+        self.buffer = bytearray(BinaryWriter.RECORD.size * BinaryWriter.BLOCK)
+        self.offset = 0
+        self.pack_into = BinaryWriter.RECORD.pack_into
+
+    def write(self, time, src, dst, event, size):
+        """
+        Appends a log record to the buffer, flushing it if full
+        :param time: simulation time
+        :param src: id of the source node
+        :param dst: id of the destination node
+        :param event: type of the record
+        :param size: packet size, queue length or node state
+        """
+        # NB: packet sizes drawn from integer distributions are floats
+        self.pack_into(self.buffer, self.offset, time, src, dst, event,
+                       int(size))
+        self.offset += BinaryWriter.RECORD.size
+        if self.offset == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered records to the file
+        """
+        self.log_file.write(memoryview(self.buffer)[:self.offset])
+        self.offset = 0
+
+    def close(self):
+        """
+        Flushes the buffer and closes the output file
+        """
+        self.flush()
+        self.log_file.close()
+
+
+class MetricsWriter:
+    """
+    Does not keep the log records: for each node (destination) and type of
+    record, it only counts the records and sums their sizes. When closed, it
+    writes a small summary CSV file with one line per node and type of record,
+    together with the time of the last record. This is all that is needed to
+    compute the metrics of a run
+    """
+
+    def __init__(self, output_file, level=DEFAULT_LEVEL,
+                 block_size=DEFAULT_BLOCK_SIZE):
+        """
+        Constructor.
+        :param output_file: output file name. will be overwritten if already
+        existing
+        :param level: compression level, for compressed files
+        :param block_size: compression block size, for compressed files
+        """
+        self.output_file = output_file
+        self.level = level
+        self.block_size = block_size
+        # map (destination, type of record) -> number of records
+        self.counts = {}
+        # map (destination, type of record) -> sum of the sizes
+        self.sizes = {}
+        # time of the last record
+        self.time = 0
+
+    def write(self, time, src, dst, event, size):
+        """
+        Accounts for a log record
+        :param time: simulation time
+        :param src: id of the source node
+        :param dst: id of the destination node
+        :param event: type of the record
+        :param size: packet size, queue length or node state
+        """
+        key = (dst, event)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.sizes[key] = self.sizes.get(key, 0) + size
+        self.time = time
+
+    def close(self):
+        """
+        Writes the summary file
+        """
+        summary = open_output(self.output_file, self.level, self.block_size)
+        summary.write("dst,event,count,size,time\n")
+        for key in sorted(self.counts.keys()):
+            summary.write("%d,%d,%d,%d,%f\n" %
+                          (key[0], key[1], self.counts[key], self.sizes[key],
+                           self.time))
+        summary.close()
+
+
+class AsyncWriter:
+    """
+    Wraps another writer, moving formatting and output to a background
+    thread. Records are appended to a batch in memory; full batches are handed
+    to the thread through a bounded queue, so the simulation only blocks if
+    the thread falls behind by more than QUEUE_SIZE batches. If the wrapped
+    writer fails, the error is raised by the next call handing a batch to the
+    thread or by close. Buffered records are written when the writer is
+    closed or, at the latest, when the interpreter exits (see close_all)
+    """
+
+    # writers not closed yet. weak references, so that closed writers are not
+    # kept alive by the single exit hook
+    open_writers = weakref.WeakSet()
+
+    # number of records in a batch
+    BATCH_SIZE = 4096
+    # maximum number of batches waiting to be written
+    QUEUE_SIZE = 16
+
+    def __init__(self, writer):
+        """
+        Constructor.
+        :param writer: the writer that actually writes the records
+        """
+        self.writer = writer
+        self.batch = []
+        self.queue = Queue(AsyncWriter.QUEUE_SIZE)
+        # exception raised by the background thread, if any
+        self.error = None
+        self.closed = False
+        self.thread = threading.Thread(target=self.consume)
+        # do not keep the interpreter alive if the writer is never closed
+        self.thread.daemon = True
+        self.thread.start()
+        AsyncWriter.open_writers.add(self)
+
+    def consume(self):
+        """
+        Body of the background thread: writes batches until the None batch.
+        After an error, batches are discarded, so that the simulation never
+        blocks on a full queue
+        """
+        write = self.writer.write
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                return
+            if self.error is not None:
+                continue
+            try:
+                for record in batch:
+                    write(*record)
+            except Exception as e:
+                self.error = e
+
+    def write(self, *record):
+        """
+        Appends a log record to the current batch
+        :param record: the arguments of the write method of the wrapped writer
+        """
+        self.batch.append(record)
+        if len(self.batch) == AsyncWriter.BATCH_SIZE:
+            if self.error is not None:
+                raise self.error
+            self.queue.put(self.batch)
+            self.batch = []
+
+    def close(self):
+        """
+        Writes all buffered records, stops the background thread and closes
+        the wrapped writer
+        """
+        if self.closed:
+            return
+        self.closed = True
+        AsyncWriter.open_writers.discard(self)
+        self.queue.put(self.batch)
+        self.queue.put(None)
+        self.thread.join()
+        self.writer.close()
+        if self.error is not None:
+            raise self.error
+
+    @staticmethod
+    def close_all():
+        """
+        Closes all the writers still open, e.g., when a run is interrupted by
+        an error. Errors of the wrapped writers are only reported, so that all
+        writers get closed
+        """
+        for writer in list(AsyncWriter.open_writers):
+            try:
+                writer.close()
+            except Exception as e:
+                print("Log error: %s" % e)
+
+
+# flush the records of the writers still open when the interpreter exits
+atexit.register(AsyncWriter.close_all)
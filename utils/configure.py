@@ -19,29 +19,35 @@ import json
 from utils import load_config
 
 
+# propagation models to simulate
+PROPAGATIONS = ['original', 'realistic']
+
+# MAC protocols to simulate, with the persistence for simple carrier sensing
+MACS = ['aloha', 'trivial', 'simple.0.0', 'simple.0.25', 'simple.0.5',
+        'simple.0.75', 'simple.1.0']
+
+
 def main():
     """
-    Generate a modified version of the configuration file given a base one.
+    Generate a configuration file covering all protocols and propagation models
+    given a base one, so that all simulations can be run in a single batch.
     """
 
     # parse command line arguments
-    n = len(sys.argv)
-    if n != 3 and n != 4:
-        print('Usage: python generate.py [propagation] [sim] [persistence]')
+    if len(sys.argv) != 1:
+        print('Usage: python configure.py')
         sys.exit(1)
 
     # load the configuration
     config = load_config('config.json')
 
     # edit the configuration
-    config['simulation']['propagation'] = sys.argv[1]
-    config['simulation']['simulator'] = sys.argv[2]
-    if n == 4:
-        config['simulation']['persistence'] = sys.argv[3]
-    else:
-        del config['simulation']['persistence']
-        config['simulation']['output'] = config['simulation']['output'] \
-            .replace('.{persistence}', '')
+    simulation = config['simulation']
+    simulation['propagation'] = PROPAGATIONS
+    simulation['mac'] = MACS
+    simulation.pop('persistence', None)
+    simulation['output'] = simulation['output'] \
+        .replace('.{persistence}', '')
 
     # print to the shell
     print(json.dumps(config, indent=4))
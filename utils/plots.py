@@ -13,15 +13,76 @@
 #
 # Copyright (C) 2017 Davide Pedranz <davide.pedranz@gmail.com>
 
+import os
 import math
+import json
+import hashlib
 import itertools
 import matplotlib as mpl
+from multiprocessing import Pool, cpu_count
 from pandas import Categorical
 from utils import mkdir
 
 mpl.use('Agg')
 import matplotlib.pyplot as plt
 
+# file storing the hash of the data of each figure, in each plots folder
+HASHES_FILE = 'hashes.json'
+
+
+def render(task):
+    """
+    Draw a figure. Used by the worker processes of render_all().
+    :param task: (output files, plotting function, arguments) tuple.
+    """
+    (_, function, args) = task
+    function(*args)
+
+
+def render_all(tasks, folder, jobs=cpu_count()):
+    """
+    Draw many figures in parallel, skipping the figures whose data has not
+    changed since the last time they were drawn. The hash of the data of each
+    figure is stored in the HASHES_FILE of the folder.
+    :param tasks: List of (output files, plotting function, arguments) tuples.
+    The arguments must only contain plain Python values (e.g., lists instead
+    of NumPy arrays), so that their representation is complete.
+    :param folder: Folder of the figures.
+    :param jobs: Number of worker processes (1 to draw serially).
+    """
+
+    # hashes of the figures already drawn
+    hashes_file = folder + HASHES_FILE
+    hashes = {}
+    if os.path.isfile(hashes_file):
+        with open(hashes_file) as f:
+            hashes = json.load(f)
+
+    # figures to draw: data changed or output missing
+    todo = []
+    for task in tasks:
+        (outputs, function, args) = task
+        digest = hashlib.sha1(function.__name__ + repr(args)).hexdigest()
+        if hashes.get(outputs[0]) != digest or \
+                not all(os.path.isfile(o) for o in outputs):
+            todo.append(task)
+        hashes[outputs[0]] = digest
+    print('  -> Drawing %d figures (%d unchanged)' %
+          (len(todo), len(tasks) - len(todo)))
+
+    if jobs <= 1:
+        for task in todo:
+            render(task)
+    else:
+        pool = Pool(jobs)
+        pool.map(render, todo, chunksize=1)
+        pool.close()
+        pool.join()
+
+    # save the hashes only once the figures are drawn
+    with open(hashes_file, 'w') as f:
+        json.dump(hashes, f, indent=0, sort_keys=True)
+
 
 def individual_metric(nodes, loads, metrics, path, title, y_label,
                       y_lim=(0, 1.05)):
@@ -45,7 +106,7 @@ def individual_metric(nodes, loads, metrics, path, title, y_label,
     plt.close(figure)
 
 
-def individual_statistic(stat, folder):
+def individual_statistic(stat, folder, jobs=cpu_count()):
     """
     Generate plots for each simulation.
     """
@@ -55,40 +116,40 @@ def individual_statistic(stat, folder):
     mkdir(base)
 
     # process each version of the simulator independently from each other
-    ids = stat.id.unique()
-    for _id in ids:
+    tasks = []
+    for (_id, df) in stat.groupby('id'):
 
-        # extract current data
-        df = stat.query('id=="' + _id + '"')
+        # one row for each node, one column for each metric and load
+        table = df[['dst', 'load', 'cr', 'dr', 'tr', 'cc']] \
+            .pivot(index='dst', columns='load')
 
         # x-axis: lambda ... load on network
-        loads = list(df['load'].unique())
-
-        # accumulators for the metrics
-        crs = []
-        drs = []
-        trs = []
-        ccs = []
+        loads = list(table['cr'].columns)
 
         # extract nodes and metrics for each node
-        nodes = df['dst'].unique()
-        for n in nodes:
-            crs.append(list(df.query('dst==' + str(n))['cr']))
-            drs.append(list(df.query('dst==' + str(n))['dr']))
-            trs.append(list(df.query('dst==' + str(n))['tr']))
-            ccs.append(list(df.query('dst==' + str(n))['cc']))
-
-        # plot the 3 metrics
-        individual_metric(nodes, loads, crs, base + _id + '_cr.png',
-                          'Collision Rate', 'Collision rate at receiver (Mbps)')
-        individual_metric(nodes, loads, drs, base + _id + '_dr.png',
-                          'Packet Drop Rate', 'Packet drop rate at the sender')
-        individual_metric(nodes, loads, trs, base + _id + '_tr.png',
-                          'Throughput', 'Throughput at receiver (Mbps)',
-                          y_lim=(0, 3))
-        individual_metric(nodes, loads, ccs, base + _id + '_cc.png',
-                          'Channel Corruption Rate',
-                          'Channel corruption rate (Mbps)')
+        nodes = list(table.index)
+        crs = table['cr'].values.tolist()
+        drs = table['dr'].values.tolist()
+        trs = table['tr'].values.tolist()
+        ccs = table['cc'].values.tolist()
+
+        # plot the 4 metrics
+        for (metrics, name, title, y_label, y_lim) in [
+            (crs, 'cr', 'Collision Rate', 'Collision rate at receiver (Mbps)',
+             (0, 1.05)),
+            (drs, 'dr', 'Packet Drop Rate', 'Packet drop rate at the sender',
+             (0, 1.05)),
+            (trs, 'tr', 'Throughput', 'Throughput at receiver (Mbps)',
+             (0, 3)),
+            (ccs, 'cc', 'Channel Corruption Rate',
+             'Channel corruption rate (Mbps)', (0, 1.05))
+        ]:
+            path = base + _id + '_' + name + '.png'
+            tasks.append(([path], individual_metric,
+                          (nodes, loads, metrics, path, title, y_label,
+                           y_lim)))
+
+    render_all(tasks, base, jobs)
 
 
 def agg_metric(legend, loc, loads, metrics, path, name, title, y_label,
@@ -97,43 +158,38 @@ def agg_metric(legend, loc, loads, metrics, path, name, title, y_label,
     Generate a plot for a single metric of all simulators.
     """
 
-    # generate 2 formats, 1 for LaTeX, 1 for visualization
-    for ext in ['pdf', 'png']:
-
-        # make sure the destination exits
-        directory = path + ext + '/'
-        mkdir(directory)
-
-        # create the figure
-        figure = plt.figure(figsize=(8, 6), dpi=80)
-        ax = figure.add_subplot(111)
-
-        # plots
-        marker = itertools.cycle((',', '>', 's', 'x', 'o', 'd', '<'))
-        for (v, l, m) in zip(legend, loads, metrics):
-            ax.plot(l, m, label=str(v), marker=marker.next())
-
-        # legend, title, axes
-        ax.legend(shadow=True, loc=loc, borderpad=0.8, fontsize='large')
-        ax.set_title(title, fontsize=20, y=1.02)
-        ax.set_xlabel('Total offered load (Mbps)', fontsize=12, labelpad=10)
-        ax.set_ylabel(y_label, fontsize=12, labelpad=10)
-        ax.tick_params(axis='both', which='major', labelsize=12)
+    # create the figure
+    figure = plt.figure(figsize=(8, 6), dpi=80)
+    ax = figure.add_subplot(111)
 
-        # axes
-        m = int(math.floor(min(map(min, loads))))
-        mm = int(math.ceil(max(map(max, loads))))
-        ax.xaxis.set_ticks(range(m, mm, 10))
-        ax.set_ylim(y_lim)
-        ax.grid(True)
+    # plots
+    marker = itertools.cycle((',', '>', 's', 'x', 'o', 'd', '<'))
+    for (v, l, m) in zip(legend, loads, metrics):
+        ax.plot(l, m, label=str(v), marker=marker.next())
+
+    # legend, title, axes
+    ax.legend(shadow=True, loc=loc, borderpad=0.8, fontsize='large')
+    ax.set_title(title, fontsize=20, y=1.02)
+    ax.set_xlabel('Total offered load (Mbps)', fontsize=12, labelpad=10)
+    ax.set_ylabel(y_label, fontsize=12, labelpad=10)
+    ax.tick_params(axis='both', which='major', labelsize=12)
+
+    # axes
+    m = int(math.floor(min(map(min, loads))))
+    mm = int(math.ceil(max(map(max, loads))))
+    ax.xaxis.set_ticks(range(m, mm, 10))
+    ax.set_ylim(y_lim)
+    ax.grid(True)
 
-        # save plot
-        figure.subplots_adjust(left=0.115, right=0.955, top=0.89, bottom=0.125)
-        figure.savefig(directory + name + '.' + ext, bbox_inches='tight')
-        plt.close(figure)
+    # save the plot in 2 formats, 1 for LaTeX, 1 for visualization
+    figure.subplots_adjust(left=0.115, right=0.955, top=0.89, bottom=0.125)
+    for ext in ['pdf', 'png']:
+        figure.savefig(path + ext + '/' + name + '.' + ext,
+                       bbox_inches='tight')
+    plt.close(figure)
 
 
-def aggregated_statistics(agg, folder):
+def aggregated_statistics(agg, folder, jobs=cpu_count()):
     """
     Generate plots for the aggregated statistics of all simulators.
     """
@@ -160,9 +216,11 @@ def aggregated_statistics(agg, folder):
 
     # compute right directory
     base = folder + 'aggregated/'
-    mkdir(base)
+    for ext in ['pdf', 'png']:
+        mkdir(base + ext + '/')
 
     # separate different propagation models
+    tasks = []
     propagation = agg.propagation.unique()
     for p in propagation:
         # extract ids to create the legend
@@ -172,23 +230,22 @@ def aggregated_statistics(agg, folder):
         # load
         loads = map(par_by_id('load'), ids)
 
-        # Throughput
-        trs = map(par_by_id('tr'), ids)
-        agg_metric(legend, 'upper right', loads, trs, base, p + '_tr',
-                   'Throughput', 'Throughput at receiver (Mbps)',
-                   y_lim=(0, 2.5 if p == 'original' else 1.5))
-
-        # Collision Rate
-        crs = map(par_by_id('cr'), ids)
-        agg_metric(legend, 'lower right', loads, crs, base, p + '_cr',
-                   'Collision Rate', 'Collision rate at receiver (Mbps)')
-
-        # Drop Rate
-        drs = map(par_by_id('dr'), ids)
-        agg_metric(legend, 'upper left', loads, drs, base, p + '_dr',
-                   'Packet Drop Rate', 'Packet drop rate at the sender')
-
-        # Channel Corruption
-        ccs = map(par_by_id('cc'), ids)
-        agg_metric(legend, 'upper right', loads, ccs, base, p + '_cc',
-                   'Channel Corruption Rate', 'Channel corruption rate (Mbps)')
+        for (par, loc, title, y_label, y_lim) in [
+            ('tr', 'upper right', 'Throughput',
+             'Throughput at receiver (Mbps)',
+             (0, 2.5 if p == 'original' else 1.5)),
+            ('cr', 'lower right', 'Collision Rate',
+             'Collision rate at receiver (Mbps)', (0, 1.05)),
+            ('dr', 'upper left', 'Packet Drop Rate',
+             'Packet drop rate at the sender', (0, 1.05)),
+            ('cc', 'upper right', 'Channel Corruption Rate',
+             'Channel corruption rate (Mbps)', (0, 1.05))
+        ]:
+            name = p + '_' + par
+            metrics = map(par_by_id(par), ids)
+            tasks.append(([base + ext + '/' + name + '.' + ext
+                           for ext in ['pdf', 'png']], agg_metric,
+                          (legend, loc, loads, metrics, base, name, title,
+                           y_label, y_lim)))
+
+    render_all(tasks, base, jobs)
@@ -16,11 +16,19 @@
 # Copyright (C) 2017 Davide Pedranz <davide.pedranz@gmail.com>
 
 import os
-import plots
+import sys
+import bz2
+import json
+import gzip
 from collections import OrderedDict
-from pandas import DataFrame, concat, read_csv, read_hdf
+from multiprocessing import Pool, cpu_count
+from optparse import OptionParser
 from utils import locate, mkdir
 
+# NB: Pandas, NumPy and the plots (Matplotlib) are imported only by the
+# functions using them, so that the script starts quickly and the statistics
+# can be computed on machines without a display stack (see main)
+
 # possible packet states
 # NB: make sure this codes match to the one used by the Log class
 
@@ -31,6 +39,69 @@ PKT_CORRUPTED_BY_CHANNEL = 3
 PKT_GENERATED = 10
 PKT_QUEUE_DROPPED = 11
 
+# records of the frames log format
+LOG_RECEIVERS = 14
+LOG_FRAME = 15
+
+# binary log format
+# NB: make sure the layout matches the one used by the BinaryWriter class
+LOG_MAGIC = b'SIMLOG01'
+LOG_RECORD = [('time', '<f8'), ('src', '<i4'), ('dst', '<i4'),
+              ('event', 'i1'), ('size', '<i4')]
+# upper bound of the codes of the records
+LOG_EVENTS = 16
+# number of records of a binary log processed at once
+BINARY_CHUNK = 1 << 22
+
+# log files generated by the simulator, possibly compressed
+LOG_SUFFIXES = ('.csv', '.bin', '.metrics')
+COMPRESSION_SUFFIXES = ('.gz', '.bz2', '.xz')
+LOG_FILES = tuple(s + c for s in LOG_SUFFIXES
+                  for c in ('',) + COMPRESSION_SUFFIXES)
+
+# columns of CSV logs needed for the statistics, with the smallest types
+# holding them. node ids use 32 bits, since random topologies can have more
+# than 32767 nodes
+CSV_DTYPES = OrderedDict([('time', 'f8'), ('dst', 'i4'), ('event', 'i1'),
+                          ('size', 'i4')])
+# number of lines of a CSV log read at once
+CSV_CHUNK = 1 << 20
+
+# index of the runs written by the simulator in each output folder
+# NB: make sure the name matches the one used by the Sim class
+INDEX_FILE = 'index.json'
+# suffix of the metadata file written by the simulator next to each log
+# NB: make sure the suffix matches the one used by the Sim class
+METADATA_SUFFIX = '.json'
+
+# entries of the indexes already read by this process, by log file name, for
+# each folder: maps the folder to a (modification time, entries) tuple
+index_cache = {}
+
+# commands of the script
+STATS = 'stats'
+PLOT = 'plot'
+
+# files written in the results folder
+STATISTICS_FILE = 'statistics.h5'
+SUMMARY_FILE = 'summary.h5'
+
+# results store: HDF5 file with a table of the processed log files and one
+# table of statistics for each propagation model and simulator id, stored as
+# statistics/{propagation}/{id}
+LOGS_KEY = 'logs'
+STATISTICS_KEY = 'statistics'
+# columns of the statistics renamed in the store, since 'lambda' is a Python
+# keyword and could not be used in queries. the name matches the one of the
+# parameter in the index of the runs
+STORED_COLUMNS = {'lambda': 'interarrival_lambda'}
+# columns of the statistics that can be used in queries (names in the store)
+DATA_COLUMNS = ['id', 'interarrival_lambda', 'seed', 'dst', 'file']
+# minimum size of the string columns of the tables (file names, simulation
+# parameters and keys of the partitions)
+LOGS_ITEMSIZE = {'file': 255, 'values': 128}
+STATISTICS_ITEMSIZE = {'file': 255, 'id': 128, 'values': 64}
+
 
 def is_number(string):
     """
@@ -45,7 +116,8 @@ def is_number(string):
 
 def get_data_files(folder, suffix=".csv"):
     """
-    Gets the list of files with a certain prefix and suffix in a folder.
+    Gets the list of files with a certain suffix (or tuple of suffixes) in a
+    folder.
     """
     files_list = []
     for f in os.listdir(folder):
@@ -54,13 +126,69 @@ def get_data_files(folder, suffix=".csv"):
     return files_list
 
 
+def read_index(folder):
+    """
+    Read the index of the runs written by the simulator in a folder of logs,
+    with the metadata and the parameters of each run.
+    :param folder: Folder where the raw files are stored.
+    :return: Pandas Dataframe with one row for each log file.
+    """
+    from pandas import DataFrame
+    with open(os.path.join(folder, INDEX_FILE)) as f:
+        return DataFrame(json.load(f))
+
+
+def query_runs(folder, query):
+    """
+    Select log files using the index of the runs, without listing the folder.
+    :param folder: Folder where the raw files are stored.
+    :param query: Pandas query on the metadata and the parameters of the
+    runs, e.g. "propagation == 'realistic' and interarrival_lambda > 1000".
+    :return: Names of the log files of the matching runs.
+    """
+    return [str(f) for f in read_index(folder).query(query)['file']]
+
+
+def log_type(name):
+    """
+    Get the type of a log file generated by the simulator, ignoring the
+    extension of the compression, if any.
+    :param name: Name of the file.
+    :return: Extension of the log, e.g. '.csv' for 'output.csv.gz'.
+    """
+    base, ext = os.path.splitext(name)
+    if ext in COMPRESSION_SUFFIXES:
+        base, ext = os.path.splitext(base)
+    return ext
+
+
+def open_compressed(path):
+    """
+    Open a log file compressed by the simulator, depending on its extension.
+    :param path: Path of the file.
+    :return: File object with the uncompressed content.
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.BZ2File(path, 'rb')
+    try:
+        import lzma
+    except ImportError:
+        from backports import lzma
+    return lzma.LZMAFile(path, 'rb')
+
+
 def parse_file_name(name):
     """
     Parse the name of a CSV file generated by a run of the simulator,
     according to the following format: 'output_{simulator}_{lambda}_{seed}.csv'
+    Only used for logs without metadata (see read_run_params).
     :param name: Name of the file.
     :return: Dictionary of the parameters used to run the simulation.
     """
+    if name.endswith(COMPRESSION_SUFFIXES):
+        name = os.path.splitext(name)[0]
     tokens = os.path.splitext(name)[0].split("_")
     a = tokens[1].split('.')
     return {
@@ -73,6 +201,162 @@ def parse_file_name(name):
     }
 
 
+def flatten(params, prefix=''):
+    """
+    Flatten nested parameters as done in the index of the runs, skipping lists,
+    e.g., interarrival.lambda becomes interarrival_lambda.
+    :param params: Dictionary of the parameters.
+    :param prefix: Prefix of the names of the parameters.
+    :return: Dictionary of the flattened parameters.
+    """
+    flat = {}
+    for (name, value) in params.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + name + '_'))
+        elif not isinstance(value, list):
+            flat[prefix + name] = value
+    return flat
+
+
+def read_index_entry(path):
+    """
+    Read the flattened parameters of the run that wrote a log file from the
+    index of its folder. The index is read once per process, and again only
+    if it changes.
+    :param path: Path of the log file.
+    :return: Dictionary of the parameters, None if not in the index.
+    """
+    folder = os.path.dirname(path)
+    index_file = os.path.join(folder, INDEX_FILE)
+    if not os.path.isfile(index_file):
+        return None
+    mtime = os.path.getmtime(index_file)
+    if folder not in index_cache or index_cache[folder][0] != mtime:
+        with open(index_file) as f:
+            entries = dict((e['file'], e) for e in json.load(f))
+        index_cache[folder] = (mtime, entries)
+    return index_cache[folder][1].get(os.path.basename(path))
+
+
+def read_run_params(path):
+    """
+    Get the parameters of the run that wrote a log file from the metadata
+    written by the simulator: the sidecar file of the log or, if missing, the
+    index of its folder. The output file name is not used, so any template
+    works. The simulator is the MAC protocol (or the simulator parameter of
+    older configurations) and the persistence is only kept for simple carrier
+    sensing, as in the names of the files generated by configure.py.
+    :param path: Path of the log file.
+    :return: Dictionary of the parameters used to run the simulation (see
+    parse_file_name), None if the metadata is not available.
+    """
+    if os.path.isfile(path + METADATA_SUFFIX):
+        with open(path + METADATA_SUFFIX) as f:
+            params = flatten(json.load(f)['params'])
+    else:
+        params = read_index_entry(path)
+    if params is None or 'interarrival_lambda' not in params:
+        return None
+
+    # simulator and persistence
+    persistence = params.get('persistence')
+    if 'mac' in params:
+        tokens = str(params['mac']).split('.', 1)
+        simulator = tokens[0]
+        if len(tokens) == 2:
+            persistence = tokens[1]
+        if simulator != 'simple':
+            persistence = None
+    else:
+        simulator = str(params.get('simulator', 'simple'))
+    p = '_' if persistence is None else str(persistence)
+
+    propagation = str(params['propagation'])
+    _id = '.'.join([propagation, simulator] + ([] if p == '_' else [p]))
+    return {
+        'id': _id,
+        'lambda': float(params['interarrival_lambda']),
+        'seed': float(params['seed']),
+        'propagation': propagation,
+        'simulator': simulator,
+        'p': p
+    }
+
+
+def read_binary(path):
+    """
+    Memory-map a binary log file generated by the simulator. Compressed files
+    can not be mapped: they are decompressed in memory.
+    :param path: Path of the file.
+    :return: NumPy record array backed by the file (no copy).
+    """
+    import numpy
+    if path.endswith(COMPRESSION_SUFFIXES):
+        with open_compressed(path) as f:
+            data = f.read()
+        if not data.startswith(LOG_MAGIC):
+            raise ValueError('%s is not a binary log file' % path)
+        return numpy.frombuffer(data, dtype=LOG_RECORD,
+                                offset=len(LOG_MAGIC))
+    with open(path, 'rb') as f:
+        if f.read(len(LOG_MAGIC)) != LOG_MAGIC:
+            raise ValueError('%s is not a binary log file' % path)
+    if os.path.getsize(path) == len(LOG_MAGIC):
+        return numpy.empty(0, dtype=LOG_RECORD)
+    return numpy.memmap(path, dtype=LOG_RECORD, mode='r',
+                        offset=len(LOG_MAGIC))
+
+
+def read_log(path):
+    """
+    Read a log file generated by the simulator, either CSV, frames or binary
+    (.bin), possibly compressed (.gz, .bz2 or .xz). Frames are expanded to
+    one record for each receiver.
+    :param path: Path of the file.
+    :return: Pandas Dataframe with the raw data.
+    """
+    from pandas import DataFrame, read_csv
+    if log_type(path) == '.bin':
+        records = read_binary(path)
+        return DataFrame(OrderedDict(
+            (name, records[name]) for (name, _) in LOG_RECORD))
+    dataframe = read_csv(path, dtype={'outcomes': str})
+    if 'outcomes' in dataframe:
+        return expand_frames(dataframe)
+    return dataframe
+
+
+def expand_frames(dataframe):
+    """
+    Expand a log in the frames format, where each transmitted frame is logged
+    as a single record with the outcomes at all receivers, to one record for
+    each receiver, as in the CSV format. Expanded records keep the time of the
+    beginning of the transmission.
+    :param dataframe: Pandas Dataframe with the raw data (frames format).
+    :return: Pandas Dataframe with the raw data (CSV format).
+    """
+    from pandas import DataFrame, concat
+    columns = ['time', 'src', 'dst', 'event', 'size']
+
+    # receivers of each source, in the order of the outcomes
+    receivers = dataframe.loc[dataframe.event == LOG_RECEIVERS]
+    neighbors = dict((src, [int(n) for n in ids.split()]) for (src, ids) in
+                     zip(receivers['src'], receivers['outcomes']))
+
+    # one record for each receiver that has logged the frame
+    frames = dataframe.loc[dataframe.event == LOG_FRAME]
+    records = []
+    for (time, src, size, outcomes) in zip(frames['time'], frames['src'],
+                                           frames['size'], frames['outcomes']):
+        for (dst, outcome) in zip(neighbors[src], outcomes):
+            if outcome != '0':
+                records.append((time, src, dst, int(outcome), size))
+
+    others = dataframe.loc[dataframe.event < LOG_RECEIVERS, columns]
+    expanded = DataFrame.from_records(records, columns=columns)
+    return concat([others, expanded], ignore_index=True)
+
+
 def offered_load(l, n_nodes, packet_size=(1460 + 32) / 2):
     """
     Total offered load in Mbps.
@@ -82,33 +366,48 @@ def offered_load(l, n_nodes, packet_size=(1460 + 32) / 2):
     return l * n_nodes * packet_size * 8 / 1024 / 1024
 
 
-def statistics(x, sim_time, load):
+def compute_stats_counts(counts, sim_time, lambda_par):
     """
-    Computes throughput, collision rate and drop rate for a specific node
-    and a specific simulation.
-    :param x Dataframe for a single node.
-    :param sim_time Total simulation time.
-    :param load Load offered for this simulation.
+    Compute throughput, collision rate, drop rate and channel corruption rate
+    for all nodes at once, given the number of records and the sum of their
+    sizes for each node and type of record.
+    :param counts: Pandas Dataframe with columns 'dst', 'event', 'count' and
+    'size' (sum of the sizes), with one row for each node and type of record.
+    :param sim_time: Total simulation time.
+    :param lambda_par: Lambda parameter.
+    :return: Statistics for this run, one row for each node.
     """
-
-    rcv_packets_df = x.loc[x.event == PKT_RECEIVED]
-
-    # number of packets for each type
-    rcv_packets = len(rcv_packets_df)
-    crp_packets = len(x.loc[x.event == PKT_CORRUPTED])
-    crp_ch_packets = len(x.loc[x.event == PKT_CORRUPTED_BY_CHANNEL])
-    gen_packets = len(x.loc[x.event == PKT_GENERATED])
-    drp_packets = len(x.loc[x.event == PKT_QUEUE_DROPPED])
+    from pandas import DataFrame, Series
+
+    # one row for each node, one column for each type of record
+    count = counts.pivot(index='dst', columns='event', values='count') \
+        .fillna(0)
+    size = counts.pivot(index='dst', columns='event', values='size') \
+        .fillna(0)
+
+    def column(table, event):
+        if event in table:
+            return table[event]
+        return Series(0, index=table.index)
+
+    rcv_size = column(size, PKT_RECEIVED)
+    rcv_packets = column(count, PKT_RECEIVED)
+    crp_packets = column(count, PKT_CORRUPTED)
+    crp_ch_packets = column(count, PKT_CORRUPTED_BY_CHANNEL)
+    gen_packets = column(count, PKT_GENERATED)
+    drp_packets = column(count, PKT_QUEUE_DROPPED)
     inc_packets = rcv_packets + crp_packets + crp_ch_packets
 
-    # return the statistics
-    return DataFrame(OrderedDict({
-        'tr': [rcv_packets_df['size'].sum() * 8 / sim_time / 1024 ** 2],
-        'cr': [float(crp_packets) / inc_packets],
-        'dr': [float(drp_packets) / gen_packets],
-        'cc': [float(crp_ch_packets) / inc_packets],
-        'load': load
-    }))
+    # compute the statistics
+    stats = DataFrame(OrderedDict([
+        ('dr', drp_packets / gen_packets),
+        ('cr', crp_packets / inc_packets),
+        ('tr', rcv_size * 8 / sim_time / 1024 ** 2),
+        ('cc', crp_ch_packets / inc_packets),
+        ('load', offered_load(lambda_par, len(count)))
+    ]), index=count.index)
+    stats.columns.name = None
+    return stats.reset_index()
 
 
 def compute_stats_single_run(dataframe, lambda_par):
@@ -118,53 +417,359 @@ def compute_stats_single_run(dataframe, lambda_par):
     :param lambda_par: Lambda parameter.
     :return: Statistics for this run.
     """
-    n_nodes = len(dataframe['dst'].unique())
-    load = offered_load(lambda_par, n_nodes)
-    stats = dataframe.groupby('dst').apply(
-        lambda x: statistics(x, dataframe.time.max(), load))
-    stats_no_index = stats.reset_index(level=1, drop=True).reset_index()
-    return stats_no_index
+    counts = dataframe.groupby(['dst', 'event'])['size'] \
+        .agg(['count', 'sum']) \
+        .rename(columns={'sum': 'size'}) \
+        .reset_index()
+    return compute_stats_counts(counts, dataframe.time.max(), lambda_par)
 
 
-def process_csv_raw_files(folder):
+def count_csv(path, chunksize=CSV_CHUNK):
     """
-    Compute the statistics for a single run of the simulator.
-    :param folder: Folder where the raw CSV files are stored.
-    :return: Statistics as a Pandas Dataframe.
+    Count the records of a CSV log for each node and type of record, and sum
+    their sizes. The file is read in chunks of typed columns, each one folded
+    into the running counters, so that memory does not depend on the size of
+    the log.
+    :param path: Path of the file.
+    :param chunksize: Number of lines read at once.
+    :return: Pandas Dataframe with columns 'dst', 'event', 'count' and 'size'
+    (see compute_stats_counts) and time of the last record.
+    """
+    import numpy
+    from pandas import DataFrame, read_csv
+    counts = None
+    time = 0.0
+    for chunk in read_csv(path, usecols=list(CSV_DTYPES.keys()),
+                          dtype=CSV_DTYPES, chunksize=chunksize):
+        current = chunk.groupby(['dst', 'event'])['size'] \
+            .agg(['count', 'sum'])
+        if counts is None:
+            counts = current
+        else:
+            counts = counts.add(current, fill_value=0)
+        time = max(time, chunk['time'].max())
+    if counts is None:
+        return DataFrame(columns=['dst', 'event', 'count', 'size']), time
+    counts = counts.astype(numpy.int64) \
+        .rename(columns={'sum': 'size'}) \
+        .reset_index()
+    return counts, time
+
+
+def count_binary(path, chunksize=BINARY_CHUNK):
+    """
+    Count the records of a binary log for each node and type of record, and
+    sum their sizes. The columns of the memory-mapped file are reduced with
+    numpy.bincount on the (dst, event) pairs, a chunk at a time, without
+    building a Dataframe of the records.
+    :param path: Path of the file.
+    :param chunksize: Number of records processed at once.
+    :return: Pandas Dataframe with columns 'dst', 'event', 'count' and 'size'
+    (see compute_stats_counts) and time of the last record.
     """
+    import numpy
+    from pandas import DataFrame
+    records = read_binary(path)
+    if len(records) == 0:
+        return DataFrame(columns=['dst', 'event', 'count', 'size']), 0.0
+
+    # one bin for each (dst, event) pair
+    bins = (int(records['dst'].max()) + 1) * LOG_EVENTS
+    count = numpy.zeros(bins, dtype=numpy.int64)
+    size = numpy.zeros(bins)
+    for start in range(0, len(records), chunksize):
+        chunk = records[start:start + chunksize]
+        key = chunk['dst'].astype(numpy.int64) * LOG_EVENTS + chunk['event']
+        count += numpy.bincount(key, minlength=bins)
+        size += numpy.bincount(key, weights=chunk['size'], minlength=bins)
+
+    # keep the pairs with at least one record
+    present = numpy.flatnonzero(count)
+    counts = DataFrame(OrderedDict([
+        ('dst', present // LOG_EVENTS),
+        ('event', present % LOG_EVENTS),
+        ('count', count[present]),
+        ('size', size[present].astype(numpy.int64))
+    ]))
+    return counts, float(records['time'].max())
+
+
+def compute_stats_summary(summary, lambda_par):
+    """
+    Compute the statistics for a single run of the simulator from the summary
+    written by the simulator in the metrics log format. The results are the
+    same of compute_stats_single_run() on the CSV log of the same run.
+    :param summary: Pandas Dataframe with the summary (number of records and
+    sum of sizes for each node and type of record, time of the last record).
+    :param lambda_par: Lambda parameter.
+    :return: Statistics for this run.
+    """
+    return compute_stats_counts(summary, summary.time.max(), lambda_par)
 
-    # store all statistics in memory
-    all_statistics = DataFrame()
 
-    # get the list of files
-    files = get_data_files(folder, ".csv")
+def process_file(path):
+    """
+    Compute the statistics for a single run of the simulator, given its raw
+    CSV (or binary, or metrics) file.
+    :param path: Path of the file.
+    :return: Statistics for this run, including the simulation parameters.
+    """
+    from pandas import read_csv
+
+    # get the parameters from the metadata of the run. the name of the file is
+    # parsed only for logs written without metadata
+    params = read_run_params(path)
+    if params is None:
+        params = parse_file_name(os.path.basename(path))
+
+    # compute statistics
+    if log_type(path) == '.metrics':
+        current_stats = compute_stats_summary(read_csv(path),
+                                              params['lambda'])
+    elif log_type(path) == '.csv' and \
+            'outcomes' not in read_csv(path, nrows=0).columns:
+        counts, time = count_csv(path)
+        current_stats = compute_stats_counts(counts, time, params['lambda'])
+    elif log_type(path) == '.bin':
+        counts, time = count_binary(path)
+        current_stats = compute_stats_counts(counts, time, params['lambda'])
+    else:
+        current_stats = compute_stats_single_run(read_log(path),
+                                                 params['lambda'])
 
-    # compute the statistics one run at a time
-    for i, f in enumerate(files):
-        print ('  -> Analyze simulation %i of %i' % (i + 1, len(files)))
+    # add columns
+    current_stats.insert(0, 'id', params['id'])
+    current_stats.insert(1, 'propagation', params['propagation'])
+    current_stats.insert(2, 'simulator', params['simulator'])
+    current_stats.insert(3, 'p', params['p'])
+    current_stats['lambda'] = params['lambda']
+    current_stats['seed'] = params['seed']
+    current_stats['file'] = os.path.basename(path)
+    return current_stats
 
-        # parse the parameters
-        params = parse_file_name(f)
 
-        # read the CSV
-        current_csv = read_csv("%s/%s" % (folder, f))
+def iterate_files(paths, jobs=cpu_count()):
+    """
+    Compute the statistics for many runs of the simulator, one run at a time
+    in each worker. Only the statistics are sent back, so at most one raw file
+    per worker is in memory at any time.
+    :param paths: Paths of the raw files.
+    :param jobs: Number of worker processes (1 to process the files serially).
+    :return: Generator of the statistics of each file, in the same order.
+    """
+    if jobs <= 1:
+        results = (process_file(path) for path in paths)
+    else:
+        pool = Pool(jobs)
+        results = pool.imap(process_file, paths)
+    for i, current_stats in enumerate(results):
+        print ('  -> Analyzed simulation %i of %i' % (i + 1, len(paths)))
+        yield current_stats
+    if jobs > 1:
+        pool.close()
+        pool.join()
+
 
-        # compute statistics
-        current_stats = compute_stats_single_run(current_csv, params['lambda'])
+def process_csv_raw_files(folder, jobs=cpu_count(), files=None):
+    """
+    Compute the statistics for all the runs of the simulator.
+    :param folder: Folder where the raw CSV (or binary, or metrics) files are
+    stored.
+    :param jobs: Number of worker processes (1 to process the files serially).
+    :param files: Names of the files to process (all log files if None).
+    :return: Statistics as a Pandas Dataframe.
+    """
+    from pandas import DataFrame, concat
 
-        # add columns
-        current_stats.insert(0, 'id', params['id'])
-        current_stats.insert(1, 'propagation', params['propagation'])
-        current_stats.insert(2, 'simulator', params['simulator'])
-        current_stats.insert(3, 'p', params['p'])
-        current_stats['lambda'] = params['lambda']
-        current_stats['seed'] = params['seed']
+    # get the list of files
+    if files is None:
+        files = get_data_files(folder, LOG_FILES)
+    paths = ["%s/%s" % (folder, f) for f in files]
 
-        # save statistics
-        all_statistics = concat([all_statistics, current_stats])
+    # collect the statistics in a list, to concatenate them only once
+    all_statistics = list(iterate_files(paths, jobs))
 
     # return the statistics for all files
-    return all_statistics.reset_index(drop=True)
+    if len(all_statistics) == 0:
+        return DataFrame()
+    return concat(all_statistics, ignore_index=True)
+
+
+def partition_key(propagation, _id):
+    """
+    Key of the table of the results store holding the statistics of a
+    simulator id.
+    :param propagation: Propagation model.
+    :param _id: Simulator id.
+    :return: HDF5 key of the partition.
+    """
+    return '/%s/%s/%s' % (STATISTICS_KEY, propagation, _id.replace('.', '_'))
+
+
+def partition_keys(store, propagation=None, _id=None):
+    """
+    Keys of the partitions of the results store, optionally only the ones of
+    a propagation model or of a simulator id.
+    :param store: Open HDFStore.
+    :param propagation: Propagation model (all if None).
+    :param _id: Simulator id (all if None).
+    :return: List of HDF5 keys.
+    """
+    prefix = '/%s/' % STATISTICS_KEY
+    if propagation is not None:
+        prefix += propagation + '/'
+    keys = [k for k in store.keys() if k.startswith(prefix)]
+    if _id is not None:
+        keys = [k for k in keys if k.endswith('/' + _id.replace('.', '_'))]
+    return keys
+
+
+def select_statistics(store, propagation=None, _id=None, where=None):
+    """
+    Read statistics from an open results store.
+    :param store: Open HDFStore.
+    :param propagation: Propagation model (all if None).
+    :param _id: Simulator id (all if None).
+    :param where: Query on the data columns (id, interarrival_lambda, seed,
+    dst, file), e.g. 'interarrival_lambda > 1000 & seed == 0'.
+    :return: Statistics as a Pandas Dataframe.
+    """
+    from pandas import DataFrame, concat
+    partitions = [store.select(k, where=where)
+                  for k in partition_keys(store, propagation, _id)]
+    if len(partitions) == 0:
+        return DataFrame()
+    names = dict((v, k) for (k, v) in STORED_COLUMNS.items())
+    return concat(partitions, ignore_index=True).rename(columns=names)
+
+
+def read_statistics(store_file, propagation=None, _id=None, where=None):
+    """
+    Read statistics from the results store written by update_statistics(),
+    loading only the partitions of a propagation model or simulator id, and
+    only the rows matching a query. Stores written by older versions hold a
+    single table, which is returned whole.
+    :param store_file: Path of the results store.
+    :param propagation: Propagation model (all if None).
+    :param _id: Simulator id (all if None).
+    :param where: Query on the data columns (id, interarrival_lambda, seed,
+    dst, file), e.g. 'interarrival_lambda > 1000 & seed == 0'.
+    :return: Statistics as a Pandas Dataframe.
+    """
+    from pandas import HDFStore
+    store = HDFStore(store_file, mode='r')
+    try:
+        keys = store.keys()
+        if '/' + LOGS_KEY not in keys and len(keys) == 1:
+            return store.get(keys[0])
+        return select_statistics(store, propagation, _id, where)
+    finally:
+        store.close()
+
+
+def update_statistics(folder, store_file, jobs=cpu_count(), query=None):
+    """
+    Compute the statistics for all the runs of the simulator, reusing the
+    statistics stored by previous executions. The results store is an HDF5
+    file with appendable tables: LOGS_KEY lists the processed files with their
+    size, modification time and partition, while the statistics are
+    partitioned by propagation model and simulator id (see partition_key).
+    Only new or modified files are processed, and their statistics are
+    appended as soon as each file is done; the statistics of files that no
+    longer exist are removed from the store. Stores written by older versions
+    are discarded, unless there are no files to process and they hold a
+    single table (e.g., the statistics distributed in the run folder).
+    :param folder: Folder where the raw CSV (or binary, or metrics) files are
+    stored.
+    :param store_file: Path of the results store.
+    :param jobs: Number of worker processes (1 to process the files serially).
+    :param query: Query on the index of the runs (see query_runs) selecting
+    the files to process. If given, only the selected files are considered
+    and the stored statistics of the other ones are left untouched.
+    :return: Statistics as a Pandas Dataframe.
+    """
+    from pandas import DataFrame, HDFStore
+
+    # current files, with size and modification time
+    names = []
+    if query is not None:
+        names = sorted(f for f in query_runs(folder, query)
+                       if os.path.isfile("%s/%s" % (folder, f)))
+    elif os.path.isdir(folder):
+        names = sorted(get_data_files(folder, LOG_FILES))
+    stats = [os.stat("%s/%s" % (folder, f)) for f in names]
+    current = DataFrame(OrderedDict([
+        ('file', names),
+        ('size', [s.st_size for s in stats]),
+        ('mtime', [s.st_mtime for s in stats])
+    ]), columns=['file', 'size', 'mtime'])
+
+    store = HDFStore(store_file)
+    try:
+        # store written by an older version
+        keys = store.keys()
+        if '/' + LOGS_KEY not in keys:
+            if len(keys) == 1 and len(names) == 0:
+                print('Using cached statistics...')
+                return store.get(keys[0])
+            for key in keys:
+                store.remove(key)
+
+        # files in the store
+        if '/' + LOGS_KEY in keys:
+            cached_all = store.select(LOGS_KEY)
+        else:
+            cached_all = DataFrame(columns=['file', 'size', 'mtime',
+                                            'partition'])
+        cached = cached_all
+        if query is not None:
+            cached = cached_all.loc[cached_all['file'].isin(names)]
+        merged = current.merge(cached, on='file', how='left',
+                               suffixes=('', '_cached'))
+        unchanged = ((merged['size'] == merged['size_cached']) &
+                     (merged['mtime'] == merged['mtime_cached'])).values
+        valid = set(merged['file'][unchanged])
+        new = current.loc[~unchanged]
+
+        # remove the files deleted or modified from the store, rewriting only
+        # the partitions holding them
+        removed = cached.loc[~cached['file'].isin(valid)]
+        if len(removed) > 0:
+            print('Removing %d files from the cache...' % len(removed))
+            for key in removed['partition'].unique():
+                kept = store.select(key)
+                kept = kept.loc[~kept['file'].isin(removed['file'])]
+                store.remove(key)
+                if len(kept) > 0:
+                    store.append(key, kept, data_columns=DATA_COLUMNS,
+                                 min_itemsize=STATISTICS_ITEMSIZE)
+            kept = cached_all.loc[~cached_all['file'].isin(removed['file'])]
+            store.remove(LOGS_KEY)
+            if len(kept) > 0:
+                store.append(LOGS_KEY, kept, data_columns=['file'],
+                             min_itemsize=LOGS_ITEMSIZE)
+
+        # process the new or modified files and append them to the store
+        print('Processing %d new files (%d cached)...' %
+              (len(new), len(valid)))
+        paths = ["%s/%s" % (folder, f) for f in new['file']]
+        for (i, new_stats) in enumerate(iterate_files(paths, jobs)):
+            key = partition_key(new_stats['propagation'].iat[0],
+                                new_stats['id'].iat[0])
+            store.append(key, new_stats.rename(columns=STORED_COLUMNS),
+                         data_columns=DATA_COLUMNS,
+                         min_itemsize=STATISTICS_ITEMSIZE)
+            log = new.iloc[[i]].assign(partition=key)
+            store.append(LOGS_KEY, log, data_columns=['file'],
+                         min_itemsize=LOGS_ITEMSIZE)
+
+        statistics = select_statistics(store)
+        if query is not None and len(statistics) > 0:
+            statistics = statistics.loc[statistics['file'].isin(names)] \
+                .reset_index(drop=True)
+        return statistics
+    finally:
+        store.close()
 
 
 def aggregate_statistics(stats):
@@ -196,53 +801,124 @@ def aggregate_statistics(stats):
     return agg
 
 
-def main():
+def mean_statistics(stats):
     """
-    Process the data generated by one or more versions of the simulator.
+    Get rid of the seeds, taking the average of the statistics over all seeds.
     """
-
-    # compute the location of the CSV files
-    csv_folder = locate('../output/')
-
-    # compute the location for the processing
-    results_folder = locate('../results/')
-    mkdir(results_folder)
-
-    # compute the statistics
-    # use cache if available, otherwise load data from raw CSV
-    aggregated_file = results_folder + 'statistics.h5'
-    if not os.path.isfile(aggregated_file):
-        print('Loading CSV files...')
-        all_statistics = process_csv_raw_files(csv_folder)
-        all_statistics.to_hdf(aggregated_file, 'statistics', format='fixed')
-    else:
-        print('Using cached statistics...')
-        all_statistics = read_hdf(aggregated_file)
-
-    # get rid of the seeds (take the average over all seeds)
-    mean_stats = all_statistics \
+    return stats \
         .groupby(['id', 'propagation', 'simulator', 'p',
                   'dst', 'load', 'lambda'], as_index=False) \
         .mean() \
         .reset_index(level=3, drop=True) \
         .drop('seed', 1)
 
+
+def compute_statistics(csv_folder, results_folder, jobs=cpu_count(),
+                       query=None):
+    """
+    Process the raw files not processed yet, updating the results store and
+    the summary of the statistics. Does not need Matplotlib.
+    :param csv_folder: Folder where the raw CSV (or binary, or metrics) files
+    are stored.
+    :param results_folder: Folder of the results store and of the summary.
+    :param jobs: Number of worker processes.
+    :param query: Query on the index of the runs selecting the files to
+    process (see update_statistics).
+    :return: Statistics of all the runs as a Pandas Dataframe.
+    """
+
+    # compute the statistics
+    # use the cache for the files already processed
+    aggregated_file = results_folder + STATISTICS_FILE
+    all_statistics = update_statistics(csv_folder, aggregated_file, jobs,
+                                       query)
+    # the summary covers all the runs, not only the selected ones
+    if query is not None:
+        all_statistics = read_statistics(aggregated_file)
+
+    # compute aggregated statistic for each version of the simulator
+    print("Aggregated stats by simulator and load...")
+    pro = aggregate_statistics(mean_statistics(all_statistics))
+
+    # store aggregated statistic in a file
+    pro.to_hdf(results_folder + SUMMARY_FILE, 'summary', format='table')
+    return all_statistics
+
+
+def plot_statistics(results_folder, jobs=cpu_count(), all_statistics=None):
+    """
+    Plot the statistics in the results store, without processing any raw file.
+    :param results_folder: Folder of the results store and of the plots.
+    :param jobs: Number of worker processes.
+    :param all_statistics: Statistics to plot (read from the results store if
+    None).
+    """
+    import plots
+
+    # read the statistics computed by compute_statistics()
+    if all_statistics is None:
+        aggregated_file = results_folder + STATISTICS_FILE
+        if not os.path.isfile(aggregated_file):
+            print("No statistics in %s: run the %s command first" %
+                  (aggregated_file, STATS))
+            sys.exit(1)
+        all_statistics = read_statistics(aggregated_file)
+    mean_stats = mean_statistics(all_statistics)
+
     # make sure the plots folder exists
-    plots_folder = locate('../results/plots/')
+    plots_folder = results_folder + 'plots/'
     mkdir(plots_folder)
 
     # plot graphs for each simulator
     print("Plotting individual statistics...")
-    plots.individual_statistic(mean_stats, plots_folder)
+    plots.individual_statistic(mean_stats, plots_folder, jobs)
 
     # compute aggregated statistic for each version of the simulator
     print("Aggregated stats by simulator and load...")
     pro = aggregate_statistics(mean_stats)
     print("Plotting aggregated statistics...")
-    plots.aggregated_statistics(pro, plots_folder)
+    plots.aggregated_statistics(pro, plots_folder, jobs)
 
-    # store aggregated statistic in a file
-    pro.to_hdf(results_folder + 'summary.h5', 'summary', format='table')
+
+def main():
+    """
+    Process the data generated by one or more versions of the simulator. The
+    "stats" command only updates the statistics, the "plot" command only plots
+    them; without a command, both are executed.
+    """
+
+    # setup command line parameters
+    parser = OptionParser(usage="usage: %prog [options] [stats|plot]",
+                          description="Computes the statistics of the runs "
+                                      "of the simulator (stats) and plots "
+                                      "them (plot)")
+    parser.add_option("-j", "--jobs", dest="jobs", default=cpu_count(),
+                      type="int", help="number of worker processes "
+                                       "[default: %default]")
+    parser.add_option("-q", "--query", dest="query", default=None,
+                      help="process only the runs matching QUERY on the "
+                           "index of the runs, e.g. \"propagation == "
+                           "'realistic'\"")
+    (options, args) = parser.parse_args()
+    commands = args if len(args) > 0 else [STATS, PLOT]
+    for command in commands:
+        if command not in (STATS, PLOT):
+            print("Unknown command %s" % command)
+            sys.exit(1)
+
+    # compute the location of the CSV files
+    csv_folder = locate('../output/')
+
+    # compute the location for the processing
+    results_folder = locate('../results/')
+    mkdir(results_folder)
+
+    all_statistics = None
+    if STATS in commands:
+        all_statistics = compute_statistics(csv_folder, results_folder,
+                                            options.jobs, options.query)
+    if PLOT in commands:
+        plot_statistics(results_folder, options.jobs, all_statistics)
 
 
 # entry point